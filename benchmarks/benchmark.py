@@ -0,0 +1,194 @@
+"""
+Times pyrite's hot paths against synthetic ledgers and prints the results
+as JSON. Run with `python3 -m benchmarks.benchmark --help`.
+
+The terminal is never touched: Program is driven through HeadlessSilica,
+which stands in for swm's silica module.
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from swm.components import Screen
+from modules import PurchaseList, ColumnarPurchaseList, datetime_tools
+from modules.storage import CSVStorage
+import pyrite
+from .generate_data import generate_data_directory
+
+
+class HeadlessKey:
+    """
+    Behaves like the keys returned by silica.get_keypress
+    """
+    def __init__(self, value=""):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other
+
+    __hash__ = None
+
+    def is_empty(self):
+        return self.value == ""
+
+    def is_character(self):
+        return isinstance(self.value, str) and len(self.value) == 1
+
+    def __str__(self):
+        return str(self.value)
+
+
+class HeadlessWindow:
+    def __init__(self, width, height):
+        self.screen = Screen(width, height)
+        self.visible = True
+
+    def set_title(self, title):
+        return self
+
+    def set_theme(self, theme):
+        pass
+
+    def draw(self, offset, content, **kwargs):
+        self.screen.draw(offset, content, **kwargs)
+
+
+class HeadlessSilica:
+    """
+    A stand-in for swm's silica module that keeps windows in memory and
+    replays queued keys instead of reading the terminal.
+    """
+    def __init__(self, width=120, height=40):
+        self.width = width
+        self.height = height
+        self.windows = {}
+        self.keys = []
+
+    def _resolve(self, value, total):
+        return value if value >= 0 else total + value + 1
+
+    def setup(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+    def process(self):
+        pass
+
+    def add_window(self, geometry, name):
+        x1, y1, x2, y2 = geometry
+        width = self._resolve(x2, self.width) - self._resolve(x1, self.width) - 2
+        height = self._resolve(y2, self.height) - self._resolve(y1, self.height) - 2
+        self.windows[name] = HeadlessWindow(max(width, 1), max(height, 1))
+        return self.windows[name]
+
+    def add_centered_window(self, size, name):
+        self.windows[name] = HeadlessWindow(*size)
+        return self.windows[name]
+
+    def get_window(self, name):
+        return self.windows[name]
+
+    def get_keypress(self):
+        if self.keys:
+            return HeadlessKey(self.keys.pop(0))
+        return HeadlessKey()
+
+
+def measure(function, repeat):
+    """
+    Calls function repeat times and returns timing statistics in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min": timings[0],
+        "median": timings[len(timings) // 2],
+        "mean": sum(timings) / repeat,
+        "max": timings[-1],
+    }
+
+
+def benchmark_ledger(purchase_count, category_count, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        categories_path, spending_data_path = generate_data_directory(directory, purchase_count, category_count)
+        results = {"purchases": purchase_count, "categories": category_count, "timings": {}}
+        timings = results["timings"]
+
+        def load_without_snapshot(purchase_list_class):
+            if os.path.exists(spending_data_path + ".snapshot"):
+                os.remove(spending_data_path + ".snapshot")
+            purchase_list_class.from_csv(spending_data_path)
+
+        timings["PurchaseList.from_csv"] = measure(lambda: load_without_snapshot(PurchaseList), repeat)
+        timings["ColumnarPurchaseList.from_csv"] = measure(lambda: load_without_snapshot(ColumnarPurchaseList), repeat)
+        timings["ColumnarPurchaseList.from_csv (snapshot)"] = measure(
+            lambda: ColumnarPurchaseList.from_csv(spending_data_path), repeat
+        )
+        purchase_list = PurchaseList.from_csv(spending_data_path)
+        results["rows_per_second"] = purchase_list.load_stats.rows_per_second
+
+        def add_and_save():
+            purchase_list.add_purchase("Category 1", 1.5)
+            purchase_list.save()
+
+        timings["PurchaseList.save"] = measure(add_and_save, repeat * 10)
+        timings["PurchaseList.compact"] = measure(purchase_list.compact, repeat)
+
+        pyrite.silica = HeadlessSilica()
+        program = pyrite.Program(CSVStorage(spending_data_path, categories_path))
+
+        def navigate_week():
+            program.time_pointer = datetime_tools.get_start_of_previous_week(program.time_pointer)
+            program.get_purchases_in_selected_week().group_purchases_by_category()
+
+        timings["week_navigation"] = measure(navigate_week, repeat * 10)
+        program.reset_time_pointer_to_now()
+        program.populate_overview_table()
+        timings["Table.render"] = measure(lambda: program.overview_table.render(80, 40), repeat * 10)
+
+        def keypress_frame():
+            pyrite.silica.keys.append(pyrite.Key.LEFT)
+            program.main()
+
+        timings["Program.main (keypress)"] = measure(keypress_frame, repeat * 10)
+        timings["Program.main (idle)"] = measure(program.main, repeat * 10)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pyrite against synthetic ledgers")
+    parser.add_argument("--purchases", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--categories", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime_tools.now().isoformat(),
+        "results": [],
+    }
+    for purchase_count in args.purchases:
+        for category_count in args.categories:
+            report["results"].append(benchmark_ledger(purchase_count, category_count, args.repeat))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Generates synthetic categories.csv and spending_data.csv files for
+benchmarking. Run with `python3 -m benchmarks.generate_data --help`.
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from modules import PurchaseList, datetime_tools
+
+
+def get_category_names(category_count):
+    """
+    Returns category_count category names. A quarter of them are food
+    categories, so that the food subtotal has something to add up.
+    """
+    names = []
+    for index in range(category_count):
+        if index % 4 == 0:
+            names.append("Food: item {}".format(index))
+        else:
+            names.append("Category {}".format(index))
+    return names
+
+
+def generate_categories(categories_file_path, category_count):
+    category_names = get_category_names(category_count)
+    with open(categories_file_path, "w", newline="") as categories_file:
+        writer = csv.writer(categories_file, lineterminator="\n")
+        writer.writerow(["name", "examples"])
+        for name in category_names:
+            writer.writerow([name, "Examples for {}".format(name.lower())])
+    return category_names
+
+
+def generate_spending_data(spending_data_file_path, purchase_count, category_names, years=10, seed=0):
+    """
+    Writes purchase_count purchases spread evenly over the given number of
+    years up to now, in the same format that PurchaseList writes.
+    """
+    rng = random.Random(seed)
+    end_time = datetime_tools.now()
+    start_time = end_time - timedelta(days=365 * years)
+    step = (end_time - start_time) / max(purchase_count, 1)
+    with open(spending_data_file_path, "w") as spending_data_file:
+        spending_data_file.write(PurchaseList.CSV_HEADER + "\n")
+        for index in range(purchase_count):
+            time_created = datetime.fromtimestamp(
+                (start_time + step * index).timestamp(), tz=datetime_tools.week_calendar.timezone
+            )
+            line = ",".join(
+                [
+                    time_created.strftime(PurchaseList.TIMESTAMP_FORMAT),
+                    rng.choice(category_names),
+                    str(rng.randrange(1, 20000) / 100),
+                ]
+            )
+            spending_data_file.write(line + "\n")
+
+
+def generate_data_directory(directory, purchase_count, category_count, years=10, seed=0):
+    """
+    Generates both files in directory and returns their paths
+    """
+    categories_file_path = os.path.join(directory, "categories.csv")
+    spending_data_file_path = os.path.join(directory, "spending_data.csv")
+    category_names = generate_categories(categories_file_path, category_count)
+    generate_spending_data(spending_data_file_path, purchase_count, category_names, years, seed)
+    return categories_file_path, spending_data_file_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic pyrite ledger")
+    parser.add_argument("directory", help="directory to write categories.csv and spending_data.csv into")
+    parser.add_argument("--purchases", type=int, default=100000)
+    parser.add_argument("--categories", type=int, default=100)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.directory, exist_ok=True)
+    generate_data_directory(args.directory, args.purchases, args.categories, args.years, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import threading
+import time
+
+
+class BackgroundWriter:
+    """
+    Saves new purchases to a PurchaseList's storage on a background thread.
+    Purchases handed over in quick succession are written together in one
+    batch, and batches are always written in the order they were saved.
+    Errors from the writer thread are kept until collected with pop_error(),
+    with one error kept for a batch however many times it's retried.
+    """
+    def __init__(self, purchase_list, coalesce_delay=0.05):
+        self.purchase_list = purchase_list
+        self.coalesce_delay = coalesce_delay  # seconds to wait for more purchases before writing
+        self._condition = threading.Condition()
+        self._queue = []
+        self._writing = False
+        self._failed = None  # the error from the last batch, which is waiting to be retried
+        self._failure_count = 0  # write attempts that have failed
+        self._closed = False
+        self._errors = []
+        self._callbacks = []  # on_written callbacks for the purchases in the queue
+        self._batch_callbacks = []  # on_written callbacks for the batch being written
+        self._thread = threading.Thread(target=self._run, name="pyrite-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, on_written=None):
+        """
+        Queues every unsaved purchase in the PurchaseList for writing and
+        returns immediately. Must be called from the thread that adds
+        purchases to the list. on_written, if given, is called with None
+        once everything queued so far has been written, or with the error
+        the first time writing it fails. It's called on the writer thread
+        with the writer's lock held, so it mustn't block or use the writer.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BackgroundWriter has been closed")
+            self._queue.extend(self.purchase_list.unsaved_purchases)
+            self.purchase_list.unsaved_purchases = []
+            if on_written is not None:
+                if self._queue:
+                    self._callbacks.append(on_written)
+                elif self._writing:
+                    self._batch_callbacks.append(on_written)
+                else:
+                    on_written(None)
+            self._condition.notify_all()
+
+    def has_pending_writes(self):
+        """
+        Returns True while a write is underway or about to start
+        """
+        with self._condition:
+            return self._writing or (bool(self._queue) and self._failed is None)
+
+    def pop_error(self):
+        """
+        Returns the most recent write error not yet collected, or None
+        """
+        with self._condition:
+            if self._errors:
+                return self._errors.pop()
+            return None
+
+    def flush(self):
+        """
+        Blocks until every queued purchase has been written. Raises the
+        error, collecting it, if a write fails.
+        """
+        with self._condition:
+            failure_count = self._failure_count
+            self._condition.notify_all()
+            while self._queue or self._writing:
+                # a failed batch may have been retried successfully before this thread woke up
+                if self._failure_count != failure_count and self._failed is not None:
+                    error = self._failed
+                    if self._errors and self._errors[-1] is error:
+                        self._errors.pop()
+                    raise error
+                self._condition.wait()
+
+    def close(self):
+        """
+        Writes everything still queued, then stops the writer thread
+        """
+        try:
+            self.flush()
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._writing = True
+            # give rapid successive entries a chance to join this batch
+            time.sleep(self.coalesce_delay)
+            with self._condition:
+                batch, self._queue = self._queue, []
+                self._batch_callbacks, self._callbacks = self._callbacks, []
+            error = None
+            try:
+                self.purchase_list.storage.append_purchases(batch)
+            except Exception as e:
+                error = e
+            with self._condition:
+                self._writing = False
+                callbacks, self._batch_callbacks = self._batch_callbacks, []
+                for on_written in callbacks:
+                    on_written(error)
+                if error is not None:
+                    # keep the batch at the front of the queue so ordering is preserved,
+                    # it is retried on the next save or flush
+                    self._queue[0:0] = batch
+                    self._failure_count += 1
+                    if self._failed is not None and self._errors and self._errors[-1] is self._failed:
+                        # the batch failed before and that error hasn't been collected yet
+                        self._errors[-1] = error
+                    else:
+                        self._errors.append(error)
+                self._failed = error
+                self._condition.notify_all()
+                if error is not None:
+                    self._condition.wait()
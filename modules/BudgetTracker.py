@@ -0,0 +1,108 @@
+from . import datetime_tools
+from .Price import Price
+
+
+class BudgetTracker:
+    """
+    Keeps running totals of the spending counted against each category's
+    budget. The totals for a week or month are worked out from the purchase
+    list the first time they're asked for, and from then on are updated as
+    purchases are added, so an entry only touches the budgets of its own
+    category and the categories above it.
+    """
+    def __init__(self, category_list, purchase_list):
+        self.category_list = category_list
+        self.purchase_list = purchase_list
+        self.budgeted_categories = {
+            category.name: category for category in category_list if category.budget is not None
+        }
+        self._spending = {}  # (budget period, start of period) -> {budgeted category name: cents spent}
+
+    def __bool__(self):
+        return bool(self.budgeted_categories)
+
+    def clear(self):
+        """
+        Forgets every running total, for when purchases have been added or
+        removed other than through add_purchase()
+        """
+        self._spending.clear()
+
+    @staticmethod
+    def get_period_start(budget_period, time):
+        if budget_period == "week":
+            return datetime_tools.get_start_of_week(time)
+        return datetime_tools.get_start_of_month(time)
+
+    def get_budgeted_names(self, category_name):
+        """
+        Returns the names of the categories whose budgets spending on
+        category_name counts against
+        """
+        budgeted_categories = self.budgeted_categories
+        return [
+            name
+            for name in (category_name,) + self.category_list.get_ancestor_names(category_name)
+            if name in budgeted_categories
+        ]
+
+    def _get_spending(self, budget_period, time):
+        period_start = self.get_period_start(budget_period, time)
+        try:
+            return self._spending[(budget_period, period_start)]
+        except KeyError:
+            pass
+        if budget_period == "week":
+            period_end = datetime_tools.get_end_of_week(time)
+        else:
+            period_end = datetime_tools.get_end_of_month(time)
+        spending = {
+            name: 0 for name, category in self.budgeted_categories.items() if category.budget_period == budget_period
+        }
+        self.purchase_list.ensure_loaded(period_start)
+        purchases = self.purchase_list.get_purchases_within_time_period(period_start, period_end)
+        for purchase_group in purchases.group_purchases_by_category():
+            for name in self.get_budgeted_names(purchase_group.category_name):
+                if name in spending:
+                    spending[name] += purchase_group.cost.cents
+        self._spending[(budget_period, period_start)] = spending
+        return spending
+
+    def get_remaining(self, category_name, time):
+        """
+        Returns the Price left of a category's budget in the week or month
+        containing time, negative once it's overspent, or None if the
+        category has no budget
+        """
+        category = self.budgeted_categories.get(category_name)
+        if category is None:
+            return None
+        spent = self._get_spending(category.budget_period, time)[category_name]
+        return Price.from_cents(category.budget.cents - spent)
+
+    def add_purchase(self, purchase):
+        """
+        Counts a purchase that has just been added to the purchase list.
+        Returns the categories whose budgets it took over.
+        """
+        cents = purchase.cost.cents
+        overspent_categories = []
+        period_spending = {}  # budget period -> running totals the purchase has been counted in
+        for name in self.get_budgeted_names(purchase.category_name):
+            category = self.budgeted_categories[name]
+            budget_period = category.budget_period
+            if budget_period not in period_spending:
+                period_start = self.get_period_start(budget_period, purchase.time_created)
+                spending = self._spending.get((budget_period, period_start))
+                if spending is None:
+                    # worked out from the purchase list, which already holds this purchase
+                    spending = self._get_spending(budget_period, purchase.time_created)
+                else:
+                    for budgeted_name in self.get_budgeted_names(purchase.category_name):
+                        if budgeted_name in spending:
+                            spending[budgeted_name] += cents
+                period_spending[budget_period] = spending
+            spending = period_spending[budget_period]
+            if spending[name] - cents <= category.budget.cents < spending[name]:
+                overspent_categories.append(category)
+        return overspent_categories
@@ -1,20 +1,191 @@
 import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from . import datetime_tools
+from .ImportHistory import ImportHistory
+from .ImportProfile import ImportProfile
+from .Price import Price
+from .PurchaseList import Purchase
 
 
 class CSVImporter:
-    def __init__(self, file_path, ignore_header=True):
-        self.ignore_header = ignore_header
+    """
+    Reads a bank export csv file and imports its rows into a PurchaseList.
+    Rows are streamed from the file one at a time, or split into chunks and
+    parsed across a process pool for very large exports.
+    """
+    CHUNK_SIZE = 16 * 1024 * 1024  # bytes per chunk when parsing in parallel
+
+    def __init__(self, file_path, ignore_header=True, profile=None):
+        if profile is None:
+            profile = ImportProfile(has_header=ignore_header)
+        self.ignore_header = profile.has_header
         self.file_path = file_path
-        self.importFromFile(file_path)
+        self.profile = profile
+        self.contents = None
 
     def importFromFile(self, file_path):
-        self.contents = []
-        with open(file_path, "r") as csv_file:
-            reader = csv.reader(csv_file, delimiter=',')
+        self.file_path = file_path
+        self.contents = list(self.rows())
+
+    def getContents(self):
+        if self.contents is None:
+            self.importFromFile(self.file_path)
+        return self.contents
+
+    def read_header(self):
+        if not self.profile.has_header:
+            return None
+        with open(self.file_path, "r", newline="") as csv_file:
+            return next(csv.reader(csv_file, delimiter=self.profile.delimiter), None)
+
+    def rows(self):
+        """
+        Yields the fields of each row in the file, skipping the header
+        """
+        for _, fields in self.numbered_rows():
+            yield fields
+
+    def numbered_rows(self):
+        """
+        Yields the line number and fields of each row in the file, skipping
+        the header
+        """
+        with open(self.file_path, "r", newline="") as csv_file:
+            reader = csv.reader(csv_file, delimiter=self.profile.delimiter)
             if self.ignore_header:
-                reader.__next__()
+                next(reader, None)
             for line in reader:
-                self.contents.append(line)
+                if line:
+                    yield reader.line_num, line
 
-    def getContents(self):
-        return(self.contents)
+    def parse(self, workers=1):
+        """
+        Returns a list of (time_created, cents, description, category_name)
+        tuples in file order, and the line numbers of rows that couldn't be
+        parsed. With more than one worker, files bigger than a chunk are
+        split on line boundaries and parsed in a process pool. Quoted fields
+        must not contain newlines when parsing in parallel.
+        """
+        column_indices = self.profile.resolve_columns(self.read_header())
+        file_size = os.path.getsize(self.file_path)
+        if workers <= 1 or file_size <= CSVImporter.CHUNK_SIZE:
+            parsed_rows = []
+            invalid_lines = []
+            parse_row = self.profile.parse_row
+            for line_number, fields in self.numbered_rows():
+                parsed_row = parse_row(fields, column_indices)
+                if parsed_row is None:
+                    invalid_lines.append(line_number)
+                else:
+                    parsed_rows.append(parsed_row)
+            return parsed_rows, invalid_lines
+
+        chunks = self._get_chunks(file_size, max(CSVImporter.CHUNK_SIZE, file_size // (workers * 4)))
+        parsed_rows = []
+        invalid_lines = []
+        lines_before = 1 if self.ignore_header else 0
+        # workers started with spawn rather than fork would otherwise parse dates in the default timezone
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=datetime_tools.set_week_calendar,
+            initargs=(datetime_tools.week_calendar,),
+        ) as executor:
+            futures = [
+                executor.submit(_parse_chunk, self.file_path, start, end, self.profile, column_indices)
+                for start, end in chunks
+            ]
+            for future in futures:
+                chunk_rows, chunk_invalid_lines, line_count = future.result()
+                parsed_rows.extend(chunk_rows)
+                invalid_lines.extend(lines_before + line_number for line_number in chunk_invalid_lines)
+                lines_before += line_count
+        return parsed_rows, invalid_lines
+
+    def _get_chunks(self, file_size, chunk_size):
+        """
+        Splits the file into (start, end) byte ranges that begin and end on
+        line boundaries, leaving out the header
+        """
+        chunks = []
+        with open(self.file_path, "rb") as csv_file:
+            start = len(csv_file.readline()) if self.ignore_header else 0
+            while start < file_size:
+                csv_file.seek(min(start + chunk_size, file_size))
+                csv_file.readline()
+                end = min(csv_file.tell(), file_size)
+                chunks.append((start, end))
+                start = end
+        return chunks
+
+    def import_into(self, purchase_list, history, workers=1, dry_run=False):
+        """
+        Adds every new spending row to purchase_list and saves them in one
+        write, skipping rows recorded in the ImportHistory, money coming in,
+        and rows that no rule puts into a category or that can't be parsed.
+        Returns an ImportResult.
+        """
+        result = ImportResult()
+        parsed_rows, result.invalid_lines = self.parse(workers)
+        result.rows = result.invalid = len(result.invalid_lines)
+        occurrences = {}
+        new_keys = []
+        new_purchases = []
+        for time_created, cents, description, category_name in parsed_rows:
+            result.rows += 1
+            occurrence_key = (time_created, cents, description)
+            occurrence = occurrences.get(occurrence_key, 0)
+            occurrences[occurrence_key] = occurrence + 1
+            key = ImportHistory.get_key(time_created, cents, description, occurrence)
+            if key in history:
+                result.duplicates += 1
+            elif cents <= 0:
+                result.credits += 1
+            elif category_name is None:
+                result.uncategorised += 1
+            else:
+                new_keys.append(key)
+                new_purchases.append(Purchase(category_name, Price.from_cents(cents), time_created))
+                result.imported += 1
+        if not dry_run and new_purchases:
+            purchase_list.add_purchases(new_purchases)
+            purchase_list.save()
+            history.add(new_keys)
+        return result
+
+
+class ImportResult:
+    """
+    Counts what happened to each row of an import
+    """
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.credits = 0
+        self.uncategorised = 0
+        self.invalid = 0
+        self.invalid_lines = []  # line numbers of the rows that couldn't be parsed
+
+    def __str__(self):
+        return "Imported {} of {} rows ({} already imported, {} incoming, {} uncategorised, {} invalid)".format(
+            self.imported, self.rows, self.duplicates, self.credits, self.uncategorised, self.invalid
+        )
+
+
+def _parse_chunk(file_path, start, end, profile, column_indices):
+    with open(file_path, "rb") as csv_file:
+        csv_file.seek(start)
+        text = csv_file.read(end - start).decode()
+    reader = csv.reader(io.StringIO(text, newline=""), delimiter=profile.delimiter)
+    parsed_rows = []
+    invalid_lines = []
+    for fields in reader:
+        if fields:
+            parsed_row = profile.parse_row(fields, column_indices)
+            if parsed_row is None:
+                invalid_lines.append(reader.line_num)
+            else:
+                parsed_rows.append(parsed_row)
+    return parsed_rows, invalid_lines, reader.line_num
@@ -1,13 +1,76 @@
+from .Price import Price
+
+
 class Category:
     """
-    Object representing a single category. Contains a name and a hint.
+    Object representing a single category. Contains a name, a hint and
+    optionally a budget for each week or month, which covers spending on the
+    category and everything under it. Names like "Food: bread" place a
+    category under a parent ("Food"), to any depth. CategoryList links
+    categories to their parents and children.
     """
-    def __init__(self, name, hint=""):
+    SEPARATOR = ": "
+    BUDGET_PERIODS = ["week", "month"]
+
+    def __init__(self, name, hint="", budget=None, budget_period="week"):
+        if budget_period not in Category.BUDGET_PERIODS:
+            raise ValueError("Budget period must be one of: " + ", ".join(Category.BUDGET_PERIODS))
         self.name = name
         self.hint = hint
+        self.budget = budget  # Price that can be spent each budget_period, or None
+        self.budget_period = budget_period
+        self.parent = None
+        self.children = []
 
     def __str__(self):
         return self.name
 
     def __len__(self):
-        return len(str(self))
\ No newline at end of file
+        return len(str(self))
+
+    @property
+    def parent_name(self):
+        return get_parent_name(self.name)
+
+    @property
+    def short_name(self):
+        return self.name.rpartition(Category.SEPARATOR)[2]
+
+    @property
+    def depth(self):
+        return self.name.count(Category.SEPARATOR)
+
+    @property
+    def budget_text(self):
+        """
+        The budget as it's written in categories.csv, see parse_budget()
+        """
+        if self.budget is None:
+            return ""
+        return "{:.2f}/{}".format(float(self.budget), self.budget_period)
+
+
+def get_parent_name(category_name):
+    """
+    Returns the name of the category's parent, or None if it is at the top
+    of the hierarchy
+    """
+    parent_name, separator, _ = category_name.rpartition(Category.SEPARATOR)
+    return parent_name if separator else None
+
+
+def parse_budget(text):
+    """
+    Parses a budget written like "80", "80/week" or "300/month" into a
+    (Price, period) pair. A budget without a period is weekly, and an empty
+    one is (None, "week").
+    """
+    amount, _, period = text.strip().partition("/")
+    period = period.strip().lower() or "week"
+    if period not in Category.BUDGET_PERIODS:
+        raise ValueError(
+            "Unknown budget period in {!r}, expected one of: {}".format(text, ", ".join(Category.BUDGET_PERIODS))
+        )
+    if not amount:
+        return None, period
+    return Price(amount.strip().lstrip("$")), period
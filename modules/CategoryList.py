@@ -1,39 +1,199 @@
-from .CSVImporter import CSVImporter
-import csv
-from .Category import Category
+from .Category import Category, get_parent_name, parse_budget
+from .Price import Price
+from .storage import CSVStorage
 
 class CategoryList:
     """
-    A container to hold categories.
+    A container to hold categories. Categories are indexed by name, and by
+    the prefixes and short substrings of their names so that search() stays
+    quick with thousands of categories.
+
+    Categories are also arranged into a tree by their names. A parent that
+    isn't listed itself (such as "Food" for "Food: bread") is stood in for
+    by a group: a Category that is part of the tree but not of the list.
     """
+    NGRAM_LENGTH = 3  # longest substring kept in the substring index
+
     def __init__(self, categories):
         for category in categories:
             if not isinstance(category, Category):
                 raise TypeError("Categories must be given an iterable containing Category instances")
-        self.categories = categories
+        self.categories = []
+        self.max_name_length = 0
+        self._categories_by_name = {}
+        self._lowered_names = []
+        self._prefix_index = {}  # lower case prefix -> positions of the categories whose names start with it
+        self._ngram_index = {}  # lower case substring -> positions of the categories whose names contain it
+        self.roots = []  # categories and groups at the top of the tree
+        self._groups = {}  # name -> group standing in for a parent that isn't listed
+        self._ancestor_names = {}  # category name -> names of its parent, grandparent and so on
+        for category in categories:
+            self._add(category)
+
 
+    @staticmethod
+    def from_storage(storage):
+        """
+        Constructs a CategoryList from the categories held by a Storage
+        """
+        categories = [Category(name, hint, *parse_budget(budget)) for name, hint, budget in storage.load_categories()]
+        return CategoryList(categories)
 
     @staticmethod
     def from_csv(csv_file_path):
         """
         Constructs a CategoryList from a csv file
         """
-        categories = []
-        with open(csv_file_path, "r") as csv_file:
-            reader = csv.reader(csv_file, delimiter=',')
-            reader.__next__()
-            for line in reader:
-                new_category = Category(line[0], line[1])
-                categories.append(new_category)
-        return CategoryList(categories)
+        return CategoryList.from_storage(CSVStorage(categories_file_path=csv_file_path))
 
     def __iter__(self):
         yield from self.categories
 
+    def __len__(self):
+        return len(self.categories)
+
+    def _add(self, category):
+        position = len(self.categories)
+        name = category.name.lower()
+        self.categories.append(category)
+        self.max_name_length = max(self.max_name_length, len(category))
+        self._categories_by_name[category.name] = category
+        self._lowered_names.append(name)
+        for end in range(1, len(name) + 1):
+            self._prefix_index.setdefault(name[:end], []).append(position)
+        ngrams = set()
+        for length in range(1, CategoryList.NGRAM_LENGTH + 1):
+            for start in range(len(name) - length + 1):
+                ngrams.add(name[start : start + length])
+        for ngram in ngrams:
+            self._ngram_index.setdefault(ngram, []).append(position)
+        self._link(category)
+
+    def _link(self, category):
+        """
+        Places a category in the tree, creating groups for any parents that
+        aren't listed
+        """
+        group = self._groups.pop(category.name, None)
+        if group is not None:
+            # the parent a group stood in for has been listed, so it takes the group's place
+            category.parent = group.parent
+            category.children = group.children
+            for child in category.children:
+                child.parent = category
+            siblings = self.roots if group.parent is None else group.parent.children
+            siblings[siblings.index(group)] = category
+            return
+        parent_name = category.parent_name
+        if parent_name is None:
+            self.roots.append(category)
+            return
+        parent = self._categories_by_name.get(parent_name) or self._groups.get(parent_name)
+        if parent is None:
+            parent = Category(parent_name)
+            self._link(parent)
+            self._groups[parent_name] = parent
+        category.parent = parent
+        parent.children.append(category)
+
     def get_names(self):
         return [cat.name for cat in self.categories]
 
+    def get_category(self, category_name):
+        """
+        Returns the category with exactly this name, or None
+        """
+        return self._categories_by_name.get(category_name)
+
+    def find_category(self, text):
+        """
+        Returns the category named text, or else the only one whose name
+        starts with text, ignoring case. Raises LookupError if there's no
+        such category or more than one.
+        """
+        category = self._categories_by_name.get(text)
+        if category is not None:
+            return category
+        positions = self._prefix_index.get(text.lower(), [])
+        exact_positions = [position for position in positions if self._lowered_names[position] == text.lower()]
+        if len(exact_positions) == 1 or len(positions) == 1:
+            return self.categories[(exact_positions or positions)[0]]
+        if not positions:
+            raise LookupError("Unknown category: " + text)
+        names = ", ".join(self.categories[position].name for position in positions[:5])
+        raise LookupError("{} could be any of {}{}".format(text, names, ", ..." if len(positions) > 5 else ""))
+
+    def get_ancestor_names(self, category_name):
+        """
+        Returns the names of a category's parent, grandparent and so on, up
+        to the top of the tree. Works for names that aren't in the list too.
+        """
+        try:
+            return self._ancestor_names[category_name]
+        except KeyError:
+            ancestor_names = []
+            parent_name = get_parent_name(category_name)
+            while parent_name is not None:
+                ancestor_names.append(parent_name)
+                parent_name = get_parent_name(parent_name)
+            ancestor_names = self._ancestor_names[category_name] = tuple(ancestor_names)
+            return ancestor_names
+
+    def get_group_totals(self, category_totals):
+        """
+        Takes a dictionary mapping category names to the Price spent on each,
+        and returns one mapping the name of every parent to the total spent on
+        it and everything below it, in one pass over category_totals
+        """
+        group_cents = {}
+        for category_name, cost in category_totals.items():
+            for ancestor_name in self.get_ancestor_names(category_name):
+                group_cents[ancestor_name] = group_cents.get(ancestor_name, 0) + cost.cents
+        for group_name in group_cents:
+            if group_name in category_totals:
+                group_cents[group_name] += category_totals[group_name].cents
+        return {group_name: Price.from_cents(cents) for group_name, cents in group_cents.items()}
+
+    def walk(self, collapsed_names=()):
+        """
+        Yields every category and group in the tree, each before its
+        children, without descending into those named in collapsed_names
+        """
+        stack = list(reversed(self.roots))
+        while stack:
+            category = stack.pop()
+            yield category
+            if category.name not in collapsed_names:
+                stack.extend(reversed(category.children))
+
     def get_hint_from_category(self, category_name):
-        for category in self.categories:
-            if category.name == category_name:
-                return(category.hint)
\ No newline at end of file
+        category = self._categories_by_name.get(category_name)
+        if category is not None:
+            return(category.hint)
+
+    def search(self, text):
+        """
+        Returns the categories whose names contain text, ignoring case.
+        Names that start with text come first, and otherwise categories
+        keep their order.
+        """
+        text = text.lower()
+        if not text:
+            return list(self.categories)
+        prefix_positions = self._prefix_index.get(text, [])
+        if len(text) <= CategoryList.NGRAM_LENGTH:
+            positions = self._ngram_index.get(text, [])
+        else:
+            # check the names containing the rarest piece of text
+            candidates = min(
+                (
+                    self._ngram_index.get(text[start : start + CategoryList.NGRAM_LENGTH], [])
+                    for start in range(len(text) - CategoryList.NGRAM_LENGTH + 1)
+                ),
+                key=len,
+            )
+            positions = [position for position in candidates if text in self._lowered_names[position]]
+        prefix_position_set = set(prefix_positions)
+        return [self.categories[position] for position in prefix_positions] + [
+            self.categories[position] for position in positions if position not in prefix_position_set
+        ]
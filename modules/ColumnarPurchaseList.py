@@ -0,0 +1,222 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from . import datetime_tools
+from .datetime_tools import to_microseconds, from_microseconds
+from .Price import Price
+from .PurchaseList import PurchaseList, PurchaseListView, Purchase
+from .storage import LedgerSnapshot
+from .WeeklyTotals import WeeklyTotals
+
+
+class ColumnarPurchaseList(PurchaseList):
+    """
+    A PurchaseList that stores purchases in typed arrays instead of as
+    Purchase objects: microseconds since the epoch, the UTC offset the
+    purchase was recorded in, an interned category id and the cost.
+    Purchase objects are only created when the list is iterated or indexed.
+    """
+    def __init__(self, purchases=()):
+        self.timestamps = array("q")  # microseconds since the epoch
+        self.utc_offsets = array("i")  # seconds east of UTC
+        self.category_ids = array("I")
+        self.costs = array("q")  # cents
+        self.category_names = []
+        self._category_ids = {}
+        self.weekly_totals = WeeklyTotals()
+        self.unsaved_purchases = []
+        self.loaded_from = None
+        for purchase in sorted(purchases, key=lambda purchase: purchase.time_created):
+            self._append(purchase.time_created, purchase.category_name, purchase.cost.cents)
+
+    @classmethod
+    def _from_rows(cls, rows):
+        # built straight into the columns, without creating a Purchase per row
+        purchase_list = cls()
+        for time_created, category_name, cost in rows:
+            purchase_list._append(time_created, category_name, Price(cost).cents)
+        purchase_list._sort()
+        return purchase_list
+
+    @classmethod
+    def _from_snapshot(cls, snapshot, rows):
+        purchase_list = cls()
+        if snapshot is not None:
+            purchase_list.timestamps = snapshot.timestamps
+            purchase_list.utc_offsets = snapshot.utc_offsets
+            purchase_list.category_ids = snapshot.category_ids
+            purchase_list.costs = snapshot.costs
+            category_names = purchase_list.category_names = list(snapshot.category_names)
+            purchase_list._category_ids = {category_name: index for index, category_name in enumerate(category_names)}
+            if snapshot.calendar_key == datetime_tools.week_calendar.key:
+                purchase_list.weekly_totals = WeeklyTotals.from_columns(
+                    snapshot.week_starts, snapshot.week_category_ids, snapshot.week_costs, category_names
+                )
+            else:
+                # weeks were counted differently when the snapshot was taken
+                get_week_start = datetime_tools.week_calendar.get_week_start_for_timestamp
+                for timestamp, category_id, cents in zip(snapshot.timestamps, snapshot.category_ids, snapshot.costs):
+                    purchase_list.weekly_totals.add(get_week_start(timestamp), category_names[category_id], cents)
+        for time_created, category_name, cost in rows:
+            purchase_list._append(time_created, category_name, Price(cost).cents)
+        if rows:
+            purchase_list._sort()
+        return purchase_list
+
+    def to_snapshot(self, source):
+        week_columns = self.weekly_totals.to_columns(self.get_category_id)
+        return LedgerSnapshot(
+            self.timestamps,
+            self.utc_offsets,
+            self.category_ids,
+            self.costs,
+            self.category_names,
+            *week_columns,
+            datetime_tools.week_calendar.key,
+            source,
+        )
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def purchases(self):
+        return PurchaseColumns(self)
+
+    def get_category_id(self, category_name):
+        try:
+            return self._category_ids[category_name]
+        except KeyError:
+            category_id = self._category_ids[category_name] = len(self.category_names)
+            self.category_names.append(category_name)
+            return category_id
+
+    def get_purchase(self, index):
+        time_created = from_microseconds(self.timestamps[index], self.utc_offsets[index])
+        category_name = self.category_names[self.category_ids[index]]
+        return Purchase(category_name, Price.from_cents(self.costs[index]), time_created)
+
+    def _encode(self, time_created, category_name, cents):
+        """
+        Converts a purchase to its column values and counts it in the
+        weekly totals
+        """
+        timestamp = to_microseconds(time_created)
+        utc_offset = int(time_created.utcoffset().total_seconds())
+        week_start = datetime_tools.week_calendar.get_week_start_for_timestamp(timestamp)
+        self.weekly_totals.add(week_start, category_name, cents)
+        return timestamp, utc_offset, self.get_category_id(category_name)
+
+    def _append(self, time_created, category_name, cents, index=None):
+        timestamp, utc_offset, category_id = self._encode(time_created, category_name, cents)
+        if index is None:
+            self.timestamps.append(timestamp)
+            self.utc_offsets.append(utc_offset)
+            self.category_ids.append(category_id)
+            self.costs.append(cents)
+        else:
+            self.timestamps.insert(index, timestamp)
+            self.utc_offsets.insert(index, utc_offset)
+            self.category_ids.insert(index, category_id)
+            self.costs.insert(index, cents)
+
+    def _drop_before(self, start_time):
+        index = bisect_left(self.timestamps, to_microseconds(start_time))
+        for name in ("timestamps", "utc_offsets", "category_ids", "costs"):
+            setattr(self, name, getattr(self, name)[index:])
+        self.weekly_totals.drop_before(start_time)
+
+    def _add_older_rows(self, rows):
+        columns = (array("q"), array("i"), array("I"), array("q"))
+        for time_created, category_name, cost in rows:
+            cents = Price(cost).cents
+            for column, value in zip(columns, self._encode(time_created, category_name, cents) + (cents,)):
+                column.append(value)
+        self.timestamps[0:0] = columns[0]
+        self.utc_offsets[0:0] = columns[1]
+        self.category_ids[0:0] = columns[2]
+        self.costs[0:0] = columns[3]
+
+    def _sort(self, start=0):
+        """
+        Puts the columns back in time order, given that the rows before
+        start already are
+        """
+        timestamps = self.timestamps
+        if all(timestamps[i] <= timestamps[i + 1] for i in range(max(start - 1, 0), len(timestamps) - 1)):
+            return
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        for name in ("timestamps", "utc_offsets", "category_ids", "costs"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, [column[i] for i in order]))
+
+    def get_purchases_within_time_period(self, start_time, end_time):
+        """
+        Returns a view over the purchases made between start_time and
+        end_time inclusive. The view shares storage with this list.
+        """
+        start_index = bisect_left(self.timestamps, to_microseconds(start_time))
+        end_index = bisect_right(self.timestamps, to_microseconds(end_time))
+        return ColumnarPurchaseListView(self, start_index, end_index)
+
+    def add_purchase(self, *args, **kwargs):
+        purchase = Purchase(*args, **kwargs)
+        timestamp = to_microseconds(purchase.time_created)
+        index = None
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            index = bisect_right(self.timestamps, timestamp)
+        self._append(purchase.time_created, purchase.category_name, purchase.cost.cents, index)
+        self.unsaved_purchases.append(purchase)
+        return purchase
+
+    def _insert_purchases(self, purchases):
+        start = len(self.timestamps)
+        for purchase in purchases:
+            self._append(purchase.time_created, purchase.category_name, purchase.cost.cents)
+        self._sort(start)
+
+    def group_purchases_by_category(self):
+        return group_columns_by_category(self, 0, len(self))
+
+
+class ColumnarPurchaseListView(PurchaseListView):
+    def group_purchases_by_category(self):
+        return group_columns_by_category(self.purchase_list, self.start_index, self.end_index)
+
+
+class PurchaseColumns:
+    """
+    A read-only sequence of Purchase objects built on demand from the
+    columns of a ColumnarPurchaseList.
+    """
+    def __init__(self, purchase_list):
+        self.purchase_list = purchase_list
+
+    def __len__(self):
+        return len(self.purchase_list)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.purchase_list.get_purchase(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("purchase index out of range")
+        return self.purchase_list.get_purchase(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.purchase_list.get_purchase(index)
+
+
+def group_columns_by_category(purchase_list, start_index, end_index):
+    category_ids = purchase_list.category_ids
+    costs = purchase_list.costs
+    category_totals = {}
+    for index in range(start_index, end_index):
+        category_id = category_ids[index]
+        category_totals[category_id] = category_totals.get(category_id, 0) + costs[index]
+    category_names = purchase_list.category_names
+    return [
+        Purchase(category_names[category_id], Price.from_cents(cents))
+        for category_id, cents in category_totals.items()
+    ]
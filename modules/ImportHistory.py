@@ -0,0 +1,40 @@
+import hashlib
+import os
+
+
+class ImportHistory:
+    """
+    A hash index of the bank export rows that have already been imported,
+    kept in a file with one hex digest per line. Rows are keyed on their
+    timestamp, amount and description, plus how many identical rows came
+    before them in the same export, so that two genuine identical purchases
+    on one day are both kept while re-importing an overlapping statement
+    skips everything already in the ledger.
+    """
+    def __init__(self, history_file_path):
+        self.history_file_path = history_file_path
+        self.keys = set()
+        if os.path.exists(history_file_path):
+            with open(history_file_path, "r") as history_file:
+                self.keys.update(line.strip() for line in history_file if line.strip())
+
+    @staticmethod
+    def get_key(time_created, cents, description, occurrence=0):
+        text = "\x1f".join([time_created.isoformat(), str(cents), description, str(occurrence)])
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, keys):
+        """
+        Records keys as imported, durably
+        """
+        keys = [key for key in keys if key not in self.keys]
+        if not keys:
+            return
+        with open(self.history_file_path, "a") as history_file:
+            history_file.write("".join(key + "\n" for key in keys))
+            history_file.flush()
+            os.fsync(history_file.fileno())
+        self.keys.update(keys)
@@ -0,0 +1,105 @@
+import json
+import re
+from datetime import datetime
+from . import datetime_tools
+
+
+class ImportProfile:
+    """
+    Describes how to read a bank export csv file: which columns hold the
+    date, amount and description, how dates are written, and the rules used
+    to put each row into a category. Columns are given either by header
+    name or by position. Rules are (pattern, category name) pairs, where the
+    pattern is a case-insensitive regular expression searched for in the
+    description; the first matching rule wins.
+    """
+    def __init__(
+        self,
+        date_column=0,
+        amount_column=1,
+        description_column=2,
+        date_format="%d/%m/%Y",
+        delimiter=",",
+        has_header=True,
+        spending_is_negative=True,
+        default_category=None,
+        rules=(),
+    ):
+        self.date_column = date_column
+        self.amount_column = amount_column
+        self.description_column = description_column
+        self.date_format = date_format
+        self.delimiter = delimiter
+        self.has_header = has_header
+        self.spending_is_negative = spending_is_negative  # banks usually export money spent as negative amounts
+        self.default_category = default_category  # category for rows no rule matches, or None to skip them
+        self.rules = [(re.compile(pattern, re.IGNORECASE), category_name) for pattern, category_name in rules]
+        self._dates = {}  # exports repeat the same dates many times, so parsed dates are memoised
+
+    @classmethod
+    def from_json(cls, profile_file_path):
+        """
+        Constructs an ImportProfile from a json file whose keys match the
+        constructor arguments. Rules are given as a list of
+        {"pattern": ..., "category": ...} objects.
+        """
+        with open(profile_file_path, "r") as profile_file:
+            settings = json.load(profile_file)
+        settings["rules"] = [(rule["pattern"], rule["category"]) for rule in settings.get("rules", [])]
+        return cls(**settings)
+
+    def get_category_names(self):
+        category_names = {category_name for _, category_name in self.rules}
+        if self.default_category is not None:
+            category_names.add(self.default_category)
+        return category_names
+
+    def resolve_columns(self, header):
+        """
+        Returns the positions of the date, amount and description columns,
+        looking up any columns given by name in the header row.
+        """
+        indices = []
+        for column in (self.date_column, self.amount_column, self.description_column):
+            if isinstance(column, int):
+                indices.append(column)
+            elif header is None:
+                raise ValueError("Column {!r} is named but the file has no header".format(column))
+            else:
+                try:
+                    indices.append(header.index(column))
+                except ValueError:
+                    raise KeyError("No column named {}".format(column))
+        return tuple(indices)
+
+    def categorise(self, description):
+        for pattern, category_name in self.rules:
+            if pattern.search(description):
+                return category_name
+        return self.default_category
+
+    def parse_row(self, fields, column_indices):
+        """
+        Converts the fields of one row to (time_created, cents, description,
+        category_name), or None if the row is missing a field or its date or
+        amount can't be read. Money coming in rather than going out gives
+        cents <= 0, and rows no rule matches have a category of None.
+        """
+        date_index, amount_index, description_index = column_indices
+        try:
+            date_text = fields[date_index]
+            try:
+                time_created = self._dates[date_text]
+            except KeyError:
+                time_created = datetime.strptime(date_text.strip(), self.date_format)
+                if time_created.tzinfo is None:
+                    time_created = datetime_tools.localize_datetime(time_created)
+                self._dates[date_text] = time_created
+            amount = fields[amount_index].strip().replace("$", "").replace(",", "")
+            cents = round(float(amount) * 100)
+            description = fields[description_index].strip()
+        except (IndexError, ValueError, OverflowError):
+            return None
+        if self.spending_is_negative:
+            cents = -cents
+        return time_created, cents, description, self.categorise(description)
@@ -0,0 +1,329 @@
+import asyncio
+import json
+import sys
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlsplit
+from . import datetime_tools
+from .BackgroundWriter import BackgroundWriter
+from .LedgerWatcher import LedgerWatcher
+from .Price import Price
+
+
+class LedgerServer:
+    """
+    Serves a PurchaseList over HTTP with JSON responses, for dashboards and
+    scripts that want to read or add purchases without parsing the ledger.
+    Requests are handled one at a time on the asyncio event loop, and hold a
+    lock while they use the purchase list so they never see it half updated
+    by changes loaded off the loop. New purchases are written by a single
+    BackgroundWriter.
+
+    GET /weeks?date=2021-03-04&count=4   totals for the week containing date
+                                         and the count - 1 weeks before it
+    GET /purchases?start=...&end=...     purchases in a range of dates or
+                                         ISO 8601 times, both inclusive
+    GET /categories                      category names, hints and budgets
+    POST /purchases                      adds {"category", "cost", "time"},
+                                         where time is optional
+    """
+    MAX_HEADER_SIZE = 16384  # bytes
+    MAX_BODY_SIZE = 65536  # bytes
+    MAX_WEEKS = 520  # weeks a single /weeks request can cover
+    CHECK_INTERVAL = 1  # seconds between checks for purchases written by other processes
+
+    def __init__(self, purchase_list, category_list):
+        self.category_list = category_list
+        self.writer = BackgroundWriter(purchase_list)
+        self.ledger_watcher = LedgerWatcher(purchase_list, self.writer)
+        self._purchase_list_lock = asyncio.Lock()  # held while the purchase list is used or changed
+        self.routes = {
+            "/weeks": {"GET": self.get_weeks},
+            "/purchases": {"GET": self.get_purchases, "POST": self.add_purchase},
+            "/categories": {"GET": self.get_categories},
+        }
+
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None, on_start=None):
+        """
+        Serves requests until cancelled, on a TCP port or, if socket_path
+        is given, a Unix socket
+        """
+        if socket_path is None:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=self.MAX_HEADER_SIZE)
+        else:
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path, limit=self.MAX_HEADER_SIZE)
+        if on_start is not None:
+            on_start(server)
+        async with server:
+            watcher = asyncio.ensure_future(self.watch_ledger())
+            try:
+                await server.serve_forever()
+            finally:
+                watcher.cancel()
+
+    @property
+    def purchase_list(self):
+        return self.ledger_watcher.purchase_list
+
+    def close(self):
+        """
+        Writes every purchase still queued
+        """
+        self.writer.close()
+
+    async def watch_ledger(self):
+        last_error = None
+        while True:
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            try:
+                await self.load_ledger_changes()
+                last_error = None
+            except Exception as e:
+                # tried again at the next check, the same error is only reported once
+                error = "{}: {}".format(type(e).__name__, e)
+                if error != last_error:
+                    print("Couldn't load changes to the ledger: " + error, file=sys.stderr)
+                last_error = error
+
+    async def load_ledger_changes(self):
+        """
+        Brings the purchase list up to date with purchases other processes
+        have written to the ledger, loading it again if it was rewritten.
+        The ledger is read off the event loop, and requests for other
+        connections wait for the lock meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._purchase_list_lock:
+            _, skipped_rows = await loop.run_in_executor(None, self.ledger_watcher.check)
+            if skipped_rows:
+                print("Skipped {} unreadable rows in the ledger".format(skipped_rows), file=sys.stderr)
+            if self.ledger_watcher.reload_pending:
+                await loop.run_in_executor(None, self.ledger_watcher.reload)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return  # the client closed the connection
+                except asyncio.LimitOverrunError:
+                    await self.send_response(writer, 431, {"error": "Request headers are too large"}, False)
+                    return
+                try:
+                    method, target, version, headers = parse_request_head(head)
+                except ValueError:
+                    await self.send_response(writer, 400, {"error": "Malformed request"}, False)
+                    return
+                keep_alive = is_keep_alive(version, headers)
+                content_length = headers.get("content-length", "0")
+                if not content_length.isdigit() or int(content_length) > self.MAX_BODY_SIZE:
+                    await self.send_response(writer, 413, {"error": "Request body is too large"}, False)
+                    return
+                body = await reader.readexactly(int(content_length))
+                status, payload = await self.handle_request(method, target, body)
+                await self.send_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, body):
+        """
+        Returns the (status, JSON payload) answering a request
+        """
+        url = urlsplit(target)
+        handlers = self.routes.get(url.path.rstrip("/") or "/")
+        if handlers is None:
+            return 404, {"error": "No such resource: " + url.path}
+        handler = handlers.get(method)
+        if handler is None:
+            return 405, {"error": "{} only accepts {}".format(url.path, ", ".join(handlers))}
+        parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if method == "POST":
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    raise RequestError("Request body must be a JSON object")
+                if not isinstance(data, dict):
+                    raise RequestError("Request body must be a JSON object")
+                return await handler(data)
+            async with self._purchase_list_lock:
+                return 200, handler(parameters)
+        except RequestError as e:
+            return 400, {"error": str(e)}
+
+    @staticmethod
+    async def send_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        head = (
+            "HTTP/1.1 {} {}\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: {}\r\n\r\n"
+        ).format(status, STATUS_REASONS[status], len(body), "keep-alive" if keep_alive else "close")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    def get_weeks(self, parameters):
+        day = parse_date(parameters.get("date"))
+        count = parse_count(parameters.get("count", "1"), self.MAX_WEEKS)
+        week_start = datetime_tools.get_start_of_week(datetime_tools.week_calendar.get_start_of_date(day))
+        weeks = []
+        for _ in range(count):
+            self.purchase_list.ensure_loaded(week_start)
+            category_totals = self.purchase_list.weekly_totals.get_category_totals(week_start)
+            group_totals = self.category_list.get_group_totals(category_totals)
+            weeks.append(
+                {
+                    "start": week_start.isoformat(),
+                    "end": datetime_tools.get_end_of_week(week_start).isoformat(),
+                    "total": sum(cost.cents for cost in category_totals.values()),
+                    "categories": {name: cost.cents for name, cost in category_totals.items()},
+                    "groups": {name: cost.cents for name, cost in group_totals.items()},
+                }
+            )
+            week_start = datetime_tools.get_start_of_previous_week(week_start)
+        return {"weeks": weeks}
+
+    def get_purchases(self, parameters):
+        if "start" not in parameters or "end" not in parameters:
+            raise RequestError("start and end are required")
+        start_time = parse_time(parameters["start"])
+        end_time = parse_time(parameters["end"], end_of_day=True)
+        self.purchase_list.ensure_loaded(start_time)
+        purchases = self.purchase_list.get_purchases_within_time_period(start_time, end_time)
+        return {"purchases": [format_purchase(purchase) for purchase in purchases]}
+
+    def get_categories(self, parameters):
+        return {
+            "categories": [
+                {
+                    "name": category.name,
+                    "hint": category.hint,
+                    "budget": None if category.budget is None else category.budget.cents,
+                    "budget_period": category.budget_period,
+                }
+                for category in self.category_list
+            ]
+        }
+
+    async def add_purchase(self, data):
+        category_name = data.get("category")
+        if not isinstance(category_name, str) or self.category_list.get_category(category_name) is None:
+            raise RequestError("Unknown category: {}".format(category_name))
+        try:
+            cost = Price(data.get("cost"))
+        except (TypeError, ValueError, OverflowError):
+            raise RequestError("cost must be a number")
+        if cost.cents <= 0:
+            raise RequestError("cost must be more than zero")
+        time_created = None
+        if data.get("time") is not None:
+            time_created = parse_time(str(data["time"]))
+        loop = asyncio.get_running_loop()
+        written = loop.create_future()
+
+        def on_written(error):
+            loop.call_soon_threadsafe(settle_future, written, error)
+
+        async with self._purchase_list_lock:
+            purchase = self.purchase_list.add_purchase(category_name, cost, time_created)
+            self.writer.save(on_written)
+        # answer once the purchase is on disk, other requests are served in the meantime
+        try:
+            await written
+        except Exception as e:
+            return 503, {"error": "Added but not saved yet: {}".format(e), "purchase": format_purchase(purchase)}
+        return 201, {"purchase": format_purchase(purchase)}
+
+
+class RequestError(Exception):
+    """
+    A request that can't be answered because of what it asked for
+    """
+
+
+STATUS_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+
+def settle_future(future, error):
+    if not future.done():
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+def parse_request_head(head):
+    """
+    Returns the method, target, HTTP version and lower case headers of a
+    request, raising ValueError if it's malformed
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def is_keep_alive(version, headers):
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+def parse_date(text):
+    if text is None:
+        return datetime_tools.now().date()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise RequestError("Dates must look like 2021-03-04, not {}".format(text))
+
+
+def parse_time(text, end_of_day=False):
+    """
+    Parses a date or an ISO 8601 time. A date stands for the start of that
+    day in local time, or its end if end_of_day is set. Times without an
+    offset are taken to be local.
+    """
+    if len(text) == 10:
+        day = parse_date(text)
+        if not end_of_day:
+            return datetime_tools.week_calendar.get_start_of_date(day)
+        next_day_start = datetime_tools.week_calendar.get_start_of_date(day + timedelta(days=1))
+        return next_day_start - datetime_tools.one_microsecond_delta
+    try:
+        return datetime_tools.parse_local_time(text)
+    except ValueError:
+        raise RequestError("Times must be in ISO 8601 format, not {}".format(text))
+
+
+def parse_count(text, maximum):
+    if not text.isdigit() or not 1 <= int(text) <= maximum:
+        raise RequestError("count must be a whole number from 1 to {}".format(maximum))
+    return int(text)
+
+
+def format_purchase(purchase):
+    return {
+        "time": purchase.time_created.isoformat(),
+        "category": purchase.category_name,
+        "cost": purchase.cost.cents,
+    }
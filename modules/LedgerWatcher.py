@@ -0,0 +1,44 @@
+class LedgerWatcher:
+    """
+    Keeps a PurchaseList in step with purchases other processes write to
+    its storage, for the interface and the server. Appended rows are added
+    to the list as they're found. When the ledger is rewritten, the list
+    is loaded again once everything queued in the BackgroundWriter has been
+    written out, so that the new copy includes it.
+    """
+    def __init__(self, purchase_list, writer):
+        self.purchase_list = purchase_list
+        self.writer = writer
+        self.reload_pending = False  # the ledger was rewritten and hasn't been loaded again yet
+
+    def check(self):
+        """
+        Adds rows other processes have appended to the ledger, and notes
+        whether it has to be loaded again with reload(). Returns whether
+        any rows were added and how many unreadable rows were skipped.
+        """
+        storage = self.purchase_list.storage
+        skipped_rows = storage.skipped_rows
+        changes = storage.load_changes()
+        added = False
+        if changes is not None:
+            rewritten, rows = changes
+            if rewritten:
+                self.reload_pending = True
+            elif rows:
+                self.purchase_list.add_rows(rows)
+                added = True
+        return added, storage.skipped_rows - skipped_rows
+
+    def reload(self):
+        """
+        Writes out every queued purchase, then loads the purchase list again
+        over the same window and returns it. If writing fails the error is
+        raised and the reload is left pending.
+        """
+        self.writer.flush()
+        purchase_list = self.purchase_list
+        purchase_list = type(purchase_list).from_storage(purchase_list.storage, purchase_list.loaded_from)
+        self.purchase_list = self.writer.purchase_list = purchase_list
+        self.reload_pending = False
+        return purchase_list
@@ -0,0 +1,65 @@
+class Price:
+    """
+    An amount of money, held as a whole number of cents so that sums are
+    exact. Use += to accumulate into an existing Price without allocating.
+    """
+    __slots__ = ("cents",)
+
+    def __init__(self, value=0):
+        if isinstance(value, Price):
+            self.cents = value.cents
+        else:
+            self.cents = round(float(value) * 100)
+
+    @classmethod
+    def from_cents(cls, cents):
+        price = cls.__new__(cls)
+        price.cents = cents
+        return price
+
+    @staticmethod
+    def sum(prices):
+        """
+        Adds up an iterable of Prices, returning a new Price
+        """
+        return Price.from_cents(sum(price.cents for price in prices))
+
+    def __str__(self):
+        return "$" + "{0:.2f}".format(self.cents / 100)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __add__(self, other):
+        return Price.from_cents(self.cents + _to_cents(other))
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __iadd__(self, other):
+        self.cents += _to_cents(other)
+        return self
+
+    def __eq__(self, other):
+        if isinstance(other, Price):
+            return self.cents == other.cents
+        return NotImplemented
+
+    __hash__ = None
+
+    def formatted(self):
+        return self.__str__()
+
+    @property
+    def value(self):
+        return float(self)
+
+    @value.setter
+    def value(self, new_value):
+        self.cents = round(float(new_value) * 100)
+
+
+def _to_cents(value):
+    if isinstance(value, Price):
+        return value.cents
+    return round(float(value) * 100)
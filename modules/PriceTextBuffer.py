@@ -1,5 +1,6 @@
 import string
 from swm.components import TextBuffer
+from .Price import Price
 
 
 class PriceTextBuffer(TextBuffer):
@@ -7,13 +8,37 @@ class PriceTextBuffer(TextBuffer):
         if not isinstance(text, str):
             raise TypeError("Text must be a string")
         for char in text:
-            if char == "." and self.buffer.count(".") == 0:
-                if len(self.buffer) == 0:
-                    self.buffer += "0."
-                else:
-                    self.buffer += char
-            if char in string.digits:
-                if "." not in self.buffer:
-                    self.buffer += char
-                elif len(self.buffer.split(".")[-1]) < 2:  # if less than two digits after decimal place
-                    self.buffer += char
+            self.buffer += get_accepted_text(self.buffer, char)
+
+
+def get_accepted_text(buffer_text, char):
+    """
+    Returns what typing char adds to a price that reads buffer_text so far,
+    or "" if it isn't accepted
+    """
+    if char == "." and buffer_text.count(".") == 0:
+        if len(buffer_text) == 0:
+            return "0."
+        return char
+    if char in string.digits:
+        if "." not in buffer_text:
+            return char
+        if len(buffer_text.split(".")[-1]) < 2:  # if less than two digits after decimal place
+            return char
+    return ""
+
+
+def parse_price_text(text):
+    """
+    Returns the Price that typing text into a PriceTextBuffer would enter.
+    Raises ValueError if the buffer wouldn't accept every character of it.
+    """
+    buffer_text = ""
+    for char in text:
+        accepted_text = get_accepted_text(buffer_text, char)
+        if not accepted_text:
+            raise ValueError("Not a valid price: {!r}".format(text))
+        buffer_text += accepted_text
+    if not buffer_text:
+        raise ValueError("Price is empty")
+    return Price(buffer_text)
@@ -0,0 +1,203 @@
+from collections import deque
+import functools
+import time
+
+
+class Profiler:
+    """
+    Times named phases of the interface. A disabled Profiler hands out a
+    shared no-op phase and instruments nothing, so leaving the calls in
+    place costs next to nothing.
+    """
+    RECENT_FRAMES = 200  # frames the live frame time summary covers
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = {}  # phase name -> PhaseStats
+        self.recent_frame_times = deque(maxlen=Profiler.RECENT_FRAMES)
+
+    def phase(self, name):
+        """
+        Returns a context manager that records how long its body takes
+        under name
+        """
+        if not self.enabled:
+            return _disabled_phase
+        return _Phase(self, name)
+
+    def record(self, name, seconds):
+        try:
+            phase_stats = self.phases[name]
+        except KeyError:
+            phase_stats = self.phases[name] = PhaseStats(name)
+        phase_stats.add(seconds)
+
+    def record_frame(self, seconds):
+        self.record("frame", seconds)
+        self.recent_frame_times.append(seconds)
+
+    def instrument(self, instance, *method_names):
+        """
+        Replaces methods on one instance with versions that are timed under
+        "ClassName.method_name". Does nothing if the profiler is disabled.
+        """
+        if not self.enabled:
+            return
+        for method_name in method_names:
+            method = getattr(instance, method_name)
+            name = type(instance).__name__ + "." + method_name
+            setattr(instance, method_name, self._time_calls(method, name))
+
+    def _time_calls(self, method, name):
+        @functools.wraps(method)
+        def timed_method(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start_time)
+        return timed_method
+
+    def get_frame_summary(self):
+        """
+        Returns the last frame time and the 95th percentile over recent
+        frames, in seconds, or None if no frames have been recorded
+        """
+        if not self.recent_frame_times:
+            return None
+        return self.recent_frame_times[-1], get_percentile(sorted(self.recent_frame_times), 95)
+
+    def get_slowest_phase(self):
+        """
+        Returns the PhaseStats of the phase, other than whole frames, with
+        the highest mean time
+        """
+        phases = [phase_stats for phase_stats in self.phases.values() if phase_stats.name != "frame"]
+        if not phases:
+            return None
+        return max(phases, key=lambda phase_stats: phase_stats.mean)
+
+    def get_overlay_lines(self):
+        """
+        Returns two lines of text summarising recent frame times and the
+        slowest phase, for a live display
+        """
+        frame_summary = self.get_frame_summary()
+        if frame_summary is None:
+            return ["No frames yet", ""]
+        slowest_phase = self.get_slowest_phase()
+        return [
+            "Frame {}  p95 {}".format(format_duration(frame_summary[0]), format_duration(frame_summary[1])),
+            "" if slowest_phase is None else "{} {}".format(slowest_phase.name, format_duration(slowest_phase.mean)),
+        ]
+
+    def write_report(self, report_file_path):
+        """
+        Writes call counts, timings and a histogram for every phase to a
+        text file
+        """
+        with open(report_file_path, "w") as report_file:
+            for phase_stats in sorted(self.phases.values(), key=lambda phase_stats: -phase_stats.total):
+                report_file.write(phase_stats.format_report() + "\n")
+
+
+class PhaseStats:
+    """
+    Call count, timings and a histogram of durations for one phase
+    """
+    # upper bounds of the histogram buckets, in seconds; the last bucket is unbounded
+    BUCKET_BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+    RECENT_SAMPLES = 1000  # samples kept for percentiles
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * (len(PhaseStats.BUCKET_BOUNDS) + 1)
+        self.recent_samples = deque(maxlen=PhaseStats.RECENT_SAMPLES)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.recent_samples.append(seconds)
+        for bucket, bound in enumerate(PhaseStats.BUCKET_BOUNDS):
+            if seconds <= bound:
+                break
+        else:
+            bucket = len(PhaseStats.BUCKET_BOUNDS)
+        self.buckets[bucket] += 1
+
+    def format_report(self):
+        samples = sorted(self.recent_samples)
+        lines = [
+            "{}: {} calls, total {}, mean {}, p50 {}, p95 {}, max {}".format(
+                self.name,
+                self.count,
+                format_duration(self.total),
+                format_duration(self.mean),
+                format_duration(get_percentile(samples, 50)),
+                format_duration(get_percentile(samples, 95)),
+                format_duration(self.maximum),
+            )
+        ]
+        lower_bound = 0
+        for bound, bucket_count in zip(PhaseStats.BUCKET_BOUNDS + [None], self.buckets):
+            if bucket_count:
+                if bound is None:
+                    label = "> " + format_duration(lower_bound)
+                else:
+                    label = "<= " + format_duration(bound)
+                bar = "#" * max(1, round(40 * bucket_count / self.count))
+                lines.append("  {:>10} {:>8} {}".format(label, bucket_count, bar))
+            lower_bound = bound
+        return "\n".join(lines)
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start_time")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start_time)
+
+
+class _DisabledPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        pass
+
+
+_disabled_phase = _DisabledPhase()
+
+
+def get_percentile(sorted_samples, percentile):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(len(sorted_samples) * percentile / 100))
+    return sorted_samples[index]
+
+
+def format_duration(seconds):
+    if seconds < 0.001:
+        return "{:.0f}us".format(seconds * 1000000)
+    if seconds < 1:
+        return "{:.2f}ms".format(seconds * 1000)
+    return "{:.2f}s".format(seconds)
@@ -1,108 +1,318 @@
-import csv
+import time
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 from . import datetime_tools
+from .Price import Price
+from .WeeklyTotals import WeeklyTotals
+from .storage import CSVStorage, LedgerSnapshot
 
 
-class PurchaseList:
-    TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+class PurchaseCollection:
+    """
+    Operations shared by PurchaseList and the slice views it hands out.
+    Subclasses must be iterable over Purchase instances.
+    """
+    def group_purchases_by_category(self):
+        category_totals = {}
+        for purchase in self:
+            category_name = purchase.category_name
+            category_totals[category_name] = category_totals.get(category_name, 0) + purchase.cost.cents
+        purchase_groups = [
+            Purchase(category_name, Price.from_cents(cents)) for category_name, cents in category_totals.items()
+        ]
+        return purchase_groups
+
+
+class PurchaseList(PurchaseCollection):
+    """
+    A container to hold purchases, kept in order of time_created so that
+    time range queries can be answered with a binary search.
+    """
+    TIMESTAMP_FORMAT = CSVStorage.TIMESTAMP_FORMAT
+    CSV_HEADER = CSVStorage.CSV_HEADER
 
     def __init__(self, purchases):
-        self.purchases = purchases
+        self.purchases = sorted(purchases, key=lambda purchase: purchase.time_created)
+        self._timestamps = [purchase.time_created for purchase in self.purchases]
+        self.weekly_totals = WeeklyTotals(self.purchases)
+        self.unsaved_purchases = []
+        self.loaded_from = None  # purchases before this time haven't been loaded yet
+
+    def __iter__(self):
+        yield from self.purchases
+
+    def __len__(self):
+        return len(self.purchases)
+
+    @classmethod
+    def from_storage(cls, storage, window_start=None):
+        """
+        Constructs a PurchaseList from the purchases held by a Storage.
+        save() and compact() write back to the same Storage. If window_start
+        is given, only purchases made from then on are kept, and older ones
+        are paged in by ensure_loaded(). Window starts must be the start of
+        a week.
+        """
+        start_time = time.perf_counter()
+        if storage.supports_snapshots:
+            purchase_list = cls._load_snapshot(storage, window_start)
+        elif window_start is None:
+            purchase_list = cls._from_rows(storage.load_purchases())
+        else:
+            purchase_list = cls._from_rows(storage.load_purchases_between(window_start))
+        purchase_list.storage = storage
+        purchase_list.loaded_from = window_start
+        purchase_list.load_stats = LoadStats(len(purchase_list), time.perf_counter() - start_time)
+        return purchase_list
+
+    @classmethod
+    def _from_rows(cls, rows):
+        return cls([Purchase(category, cost, time_created) for time_created, category, cost in rows])
+
+    @classmethod
+    def _load_snapshot(cls, storage, window_start=None):
+        """
+        Constructs a PurchaseList from a storage's snapshot and any rows
+        added since it was taken, then brings the snapshot up to date. The
+        snapshot covers the whole ledger, so purchases before window_start
+        are only dropped once it has been saved.
+        """
+        snapshot, rows, source = storage.load_snapshot()
+        purchase_list = cls._from_snapshot(snapshot, rows)
+        if source is not None and (snapshot is None or rows or snapshot.source != source):
+            try:
+                storage.save_snapshot(purchase_list.to_snapshot(source))
+            except OSError:
+                pass  # the snapshot is only a cache, the csv file is still there
+        if window_start is not None:
+            purchase_list._drop_before(window_start)
+        return purchase_list
+
+    @classmethod
+    def _from_snapshot(cls, snapshot, rows):
+        purchases = [Purchase(category, cost, time_created) for time_created, category, cost in rows]
+        if snapshot is not None:
+            category_names = snapshot.category_names
+            for timestamp, utc_offset, category_id, cents in zip(
+                snapshot.timestamps, snapshot.utc_offsets, snapshot.category_ids, snapshot.costs
+            ):
+                time_created = datetime_tools.from_microseconds(timestamp, utc_offset)
+                purchases.append(Purchase(category_names[category_id], Price.from_cents(cents), time_created))
+        return cls(purchases)
+
+    def to_snapshot(self, source):
+        """
+        Returns a LedgerSnapshot of every loaded purchase. source is the
+        (size, mtime, digest) of the file the purchases were loaded from.
+        """
+        category_ids = {}
+
+        def get_category_id(category_name):
+            return category_ids.setdefault(category_name, len(category_ids))
+
+        columns = (array("q"), array("i"), array("I"), array("q"))
+        for purchase in self.purchases:
+            time_created = purchase.time_created
+            columns[0].append(datetime_tools.to_microseconds(time_created))
+            columns[1].append(int(time_created.utcoffset().total_seconds()))
+            columns[2].append(get_category_id(purchase.category_name))
+            columns[3].append(purchase.cost.cents)
+        week_columns = self.weekly_totals.to_columns(get_category_id)
+        return LedgerSnapshot(
+            *columns, list(category_ids), *week_columns, datetime_tools.week_calendar.key, source
+        )
+
+    def ensure_loaded(self, start_time=None):
+        """
+        Pages in any purchases made from start_time onwards that haven't
+        been loaded yet. Pass None to load the whole ledger.
+        """
+        if self.loaded_from is None:
+            return
+        if start_time is not None and start_time >= self.loaded_from:
+            return
+        rows = self._get_storage().load_purchases_between(start_time, self.loaded_from)
+        self._add_older_rows(sorted(rows, key=lambda row: row[0]))
+        self.loaded_from = start_time
+
+    def _drop_before(self, start_time):
+        index = bisect_left(self._timestamps, start_time)
+        del self.purchases[:index]
+        del self._timestamps[:index]
+        self.weekly_totals.drop_before(start_time)
+
+    def _add_older_rows(self, rows):
+        """
+        Adds time-ordered rows that all predate the purchases already loaded
+        """
+        purchases = [Purchase(category, cost, time_created) for time_created, category, cost in rows]
+        self.purchases[0:0] = purchases
+        self._timestamps[0:0] = [purchase.time_created for purchase in purchases]
+        for purchase in purchases:
+            self.weekly_totals.add_purchase(purchase)
 
     @classmethod
     def from_csv(cls, purchases_file_path):
         """
         Constructs a PurchaseList from a csv file
         """
-        purchases = []
-        with open(purchases_file_path, "r") as csv_file:
-            reader = csv.reader(csv_file, delimiter=",")
-            reader.__next__()
-            for line in reader:
-                time_created = datetime.strptime(line[0], PurchaseList.TIMESTAMP_FORMAT)
-                category = line[1]
-                cost = line[2]
-                new_purchase = Purchase(category, cost, time_created)
-                purchases.append(new_purchase)
-        purchase_list = PurchaseList(purchases)
+        purchase_list = cls.from_storage(CSVStorage(purchases_file_path))
         purchase_list.purchases_file_path = purchases_file_path
         return purchase_list
 
     def to_csv(self, purchases_file_path):
-        output_spreadsheet = ["Timestamp,Category,Cost"]
-        for purchase in self.purchases:
-            line = ",".join(
-                [
-                    purchase.time_created.strftime(PurchaseList.TIMESTAMP_FORMAT),
-                    purchase.category_name,
-                    str(float(purchase.cost)),
-                ]
-            )
-            output_spreadsheet.append(line)
-        with open(purchases_file_path, "w") as purchases_file:
-            for line in output_spreadsheet:
-                purchases_file.write(line + "\n")
+        """
+        Writes every purchase to a csv file, replacing it atomically
+        """
+        CSVStorage(purchases_file_path).write_purchases(self.purchases)
 
-    def save(self):
+    def _get_storage(self):
         try:
-            self.to_csv(self.purchases_file_path)
+            return self.storage
         except AttributeError:
-            raise AttributeError("Can only be used on a PurchaseList loaded from a file")
+            raise AttributeError("Can only be used on a PurchaseList loaded from storage")
 
-    def get_purchases_within_time_period(self, start_time, end_time):
-        selected_purchases = []
-        for purchase in self.purchases:
-            if start_time <= purchase.time_created <= end_time:
-                selected_purchases.append(purchase)
-        return PurchaseList(selected_purchases)
+    def save(self):
+        """
+        Appends any purchases added since the last save to the storage this
+        list was loaded from.
+        """
+        storage = self._get_storage()
+        purchases, self.unsaved_purchases = self.unsaved_purchases, []
+        if purchases:
+            try:
+                storage.append_purchases(purchases)
+            except BaseException:
+                self.unsaved_purchases[0:0] = purchases
+                raise
 
-    def group_purchases_by_category(self):
-        category_totals = {}
-        for purchase in self.purchases:
-            category_name = purchase.category_name
-            cost = purchase.cost
-            if category_name in category_totals:
-                category_totals[category_name] += cost
-            else:
-                category_totals[category_name] = cost
-        purchase_groups = [Purchase(category_name, cost) for category_name, cost in category_totals.items()]
-        return purchase_groups
+    def compact(self):
+        """
+        Rewrites the storage this list was loaded from in time order,
+        replacing it atomically. Any history not yet loaded is loaded first,
+        as are rows other processes have appended since.
+        """
+        self.ensure_loaded()
+        storage = self._get_storage()
+        changes = storage.load_changes()
+        if changes is not None and not changes[0]:
+            self.add_rows(changes[1])
+        storage.write_purchases(self.purchases)
+        self.unsaved_purchases = []
+
+    def get_purchases_within_time_period(self, start_time, end_time):
+        """
+        Returns a view over the purchases made between start_time and
+        end_time inclusive. The view shares storage with this list.
+        """
+        start_index = bisect_left(self._timestamps, start_time)
+        end_index = bisect_right(self._timestamps, end_time)
+        return PurchaseListView(self, start_index, end_index)
 
     def add_purchase(self, *args, **kwargs):
-        self.purchases.append(Purchase(*args, **kwargs))
+        purchase = Purchase(*args, **kwargs)
+        time_created = purchase.time_created
+        if not self._timestamps or time_created >= self._timestamps[-1]:
+            self.purchases.append(purchase)
+            self._timestamps.append(time_created)
+        else:
+            # out-of-order insert, keep both lists sorted
+            index = bisect_right(self._timestamps, time_created)
+            self.purchases.insert(index, purchase)
+            self._timestamps.insert(index, time_created)
+        self.weekly_totals.add_purchase(purchase)
+        self.unsaved_purchases.append(purchase)
+        return purchase
 
+    def add_purchases(self, purchases):
+        """
+        Adds many Purchase objects at once, sorting once instead of
+        inserting each one in place
+        """
+        purchases = list(purchases)
+        self._insert_purchases(purchases)
+        self.unsaved_purchases.extend(purchases)
 
-class Purchase:
-    def __init__(self, category_name: str, cost, time_created=None):
-        if time_created is None:
-            time_created = datetime_tools.now()
-        if not isinstance(time_created, datetime):
-            raise ValueError("time_created must be a datetime object")
-        self.time_created = time_created
-        self.category_name = category_name
-        self.cost = Price(cost)
+    def add_rows(self, rows):
+        """
+        Adds (time_created, category_name, cost) rows that are already in
+        storage, such as rows another process has appended, without queueing
+        them to be saved. Rows from before the loaded window are left to be
+        paged in with the rest of their weeks.
+        """
+        if self.loaded_from is not None:
+            rows = [row for row in rows if row[0] >= self.loaded_from]
+        self._insert_purchases([Purchase(category, cost, time_created) for time_created, category, cost in rows])
 
+    def _insert_purchases(self, purchases):
+        purchases = sorted(purchases, key=lambda purchase: purchase.time_created)
+        if not purchases:
+            return
+        if self._timestamps and purchases[0].time_created < self._timestamps[-1]:
+            self.purchases = sorted(self.purchases + purchases, key=lambda purchase: purchase.time_created)
+            self._timestamps = [purchase.time_created for purchase in self.purchases]
+        else:
+            self.purchases.extend(purchases)
+            self._timestamps.extend(purchase.time_created for purchase in purchases)
+        for purchase in purchases:
+            self.weekly_totals.add_purchase(purchase)
 
-class Price:
-    def __init__(self, value):
-        self._value = float(value)
+
+class LoadStats:
+    """
+    Records how long it took to load a ledger.
+    """
+    def __init__(self, rows, seconds):
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        if self.seconds <= 0:
+            return float("inf")
+        return self.rows / self.seconds
 
     def __str__(self):
-        return "$" + "{0:.2f}".format(self._value)
+        return "Loaded {} rows in {:.3f}s ({:.0f} rows/s)".format(self.rows, self.seconds, self.rows_per_second)
+
+
+class PurchaseListView(PurchaseCollection):
+    """
+    A read-only window onto a contiguous, time-ordered run of purchases in
+    a PurchaseList. Creating a view does not copy any purchases.
+    """
+    def __init__(self, purchase_list, start_index, end_index):
+        self.purchase_list = purchase_list
+        self.start_index = start_index
+        self.end_index = end_index
 
-    def __float__(self):
-        return float(self._value)
+    def __iter__(self):
+        purchases = self.purchase_list.purchases
+        for index in range(self.start_index, self.end_index):
+            yield purchases[index]
 
-    def __add__(self, other):
-        return Price(float(self) + float(other))
+    def __len__(self):
+        return self.end_index - self.start_index
 
-    def formatted(self):
-        return self.__str__()
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("purchase index out of range")
+        return self.purchase_list.purchases[self.start_index + index]
 
     @property
-    def value(self):
-        return self._value
+    def purchases(self):
+        return self.purchase_list.purchases[self.start_index : self.end_index]
 
-    @value.setter
-    def _set_value(self, new_value):
-        self._value = float(new_value)
+
+class Purchase:
+    def __init__(self, category_name: str, cost, time_created=None):
+        if time_created is None:
+            time_created = datetime_tools.now()
+        if not isinstance(time_created, datetime):
+            raise ValueError("time_created must be a datetime object")
+        self.time_created = time_created
+        self.category_name = category_name
+        self.cost = Price(cost)
@@ -0,0 +1,216 @@
+import csv
+from array import array
+from datetime import date
+from . import datetime_tools
+
+try:
+    import numpy
+except ImportError:  # only needed for reports
+    numpy = None
+
+
+class SpendingAnalytics:
+    """
+    Batch statistics over a whole ledger. The ledger is copied into NumPy
+    arrays once, and every statistic is computed over those arrays without
+    a Python loop per purchase or per period. Periods are weeks, months or
+    years in the current datetime_tools.week_calendar.
+    """
+    PERIODS = ["week", "month", "year"]
+
+    def __init__(self, timestamps, category_ids, costs, category_names):
+        if numpy is None:
+            raise ImportError("Spending reports need NumPy, install it with `pip3 install numpy`")
+        self.timestamps = numpy.asarray(timestamps, dtype=numpy.int64)  # microseconds since the epoch
+        self.category_ids = numpy.asarray(category_ids, dtype=numpy.int64)
+        self.costs = numpy.asarray(costs, dtype=numpy.int64)  # cents
+        self.category_names = list(category_names)
+
+    @classmethod
+    def from_purchase_list(cls, purchase_list):
+        """
+        Copies a PurchaseList into arrays. A ColumnarPurchaseList's columns
+        are used directly.
+        """
+        if numpy is None:
+            raise ImportError("Spending reports need NumPy, install it with `pip3 install numpy`")
+        try:
+            return cls(
+                numpy.frombuffer(purchase_list.timestamps, dtype=numpy.int64),
+                numpy.frombuffer(purchase_list.category_ids, dtype=numpy.uint32),
+                numpy.frombuffer(purchase_list.costs, dtype=numpy.int64),
+                purchase_list.category_names,
+            )
+        except AttributeError:
+            pass
+        category_ids = {}
+        columns = (array("q"), array("q"), array("q"))
+        for purchase in purchase_list:
+            columns[0].append(datetime_tools.to_microseconds(purchase.time_created))
+            columns[1].append(category_ids.setdefault(purchase.category_name, len(category_ids)))
+            columns[2].append(purchase.cost.cents)
+        return cls(*(numpy.frombuffer(column, dtype=numpy.int64) for column in columns), category_ids)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def get_period_starts(self, period):
+        """
+        Returns the start of every period from the one holding the first
+        purchase to the one after the last purchase, as local dates
+        """
+        week_calendar = datetime_tools.week_calendar
+        first_time = week_calendar.get_local_date(datetime_tools.from_microseconds(int(self.timestamps.min()), 0))
+        last_time = week_calendar.get_local_date(datetime_tools.from_microseconds(int(self.timestamps.max()), 0))
+        if period == "week":
+            first_week = week_calendar.get_week_ordinal(first_time)
+            last_week = week_calendar.get_week_ordinal(last_time)
+            return [date.fromordinal(ordinal) for ordinal in range(first_week, last_week + 8, 7)]
+        if period == "month":
+            first_month = first_time.year * 12 + first_time.month - 1
+            last_month = last_time.year * 12 + last_time.month - 1
+            return [date(month // 12, month % 12 + 1, 1) for month in range(first_month, last_month + 2)]
+        if period == "year":
+            return [date(year, 1, 1) for year in range(first_time.year, last_time.year + 2)]
+        raise ValueError("Unknown period {}, expected one of {}".format(period, ", ".join(SpendingAnalytics.PERIODS)))
+
+    def get_period_totals(self, period):
+        """
+        Returns (period starts, totals) where totals[i, j] is the number of
+        cents spent in period i on category j. Periods without purchases are
+        included so that consecutive rows are consecutive periods.
+        """
+        if not len(self):
+            return [], numpy.zeros((0, len(self.category_names)), dtype=numpy.int64)
+        period_starts = self.get_period_starts(period)
+        week_calendar = datetime_tools.week_calendar
+        boundaries = numpy.array(
+            [datetime_tools.to_microseconds(week_calendar.get_start_of_date(day)) for day in period_starts],
+            dtype=numpy.int64,
+        )
+        period_indexes = numpy.searchsorted(boundaries, self.timestamps, side="right") - 1
+        period_count = len(period_starts) - 1
+        category_count = len(self.category_names)
+        cells = period_indexes * category_count + self.category_ids
+        totals = numpy.bincount(cells, weights=self.costs, minlength=period_count * category_count)
+        totals = numpy.rint(totals).astype(numpy.int64).reshape(period_count, category_count)
+        return period_starts[:-1], totals
+
+    @staticmethod
+    def get_rolling_means(values, window):
+        """
+        Returns the mean of each value and the window - 1 values before it,
+        or of as many as there are near the start
+        """
+        cumulative = numpy.cumsum(numpy.concatenate(([0], values)), dtype=numpy.float64)
+        counts = numpy.minimum(numpy.arange(1, len(values) + 1), window)
+        ends = numpy.arange(1, len(values) + 1)
+        return (cumulative[ends] - cumulative[ends - counts]) / counts
+
+    @staticmethod
+    def get_changes(values):
+        """
+        Returns the difference between each value and the one before it,
+        with the first value compared to zero
+        """
+        return numpy.diff(values, prepend=0)
+
+    def get_category_summary(self, period, percentiles=(50, 90)):
+        """
+        Returns a list of (category name, total cents, share of all spending,
+        mean cents per period, {percentile: cents per period}, largest
+        period's cents), biggest total first
+        """
+        period_starts, totals = self.get_period_totals(period)
+        if not len(period_starts):
+            return []
+        category_totals = totals.sum(axis=0)
+        grand_total = category_totals.sum()
+        means = totals.mean(axis=0)
+        maximums = totals.max(axis=0)
+        percentile_values = numpy.percentile(totals, percentiles, axis=0)
+        summary = []
+        for category_id in numpy.argsort(-category_totals, kind="stable"):
+            if category_totals[category_id] == 0:
+                continue
+            summary.append(
+                (
+                    self.category_names[category_id],
+                    int(category_totals[category_id]),
+                    float(category_totals[category_id] / grand_total) if grand_total else 0.0,
+                    float(means[category_id]),
+                    {
+                        percentile: float(percentile_values[index, category_id])
+                        for index, percentile in enumerate(percentiles)
+                    },
+                    int(maximums[category_id]),
+                )
+            )
+        return summary
+
+    def format_report(self, out, period, format="text", rolling=3, top=20):
+        """
+        Writes the total, rolling mean and change for every period, followed
+        by a summary of the top categories, to out as aligned text or csv
+        """
+        period_starts, totals = self.get_period_totals(period)
+        period_totals = totals.sum(axis=1)
+        rolling = max(rolling, 1)
+        rolling_means = self.get_rolling_means(period_totals, rolling)
+        changes = self.get_changes(period_totals)
+        summary = self.get_category_summary(period)[:top]
+        rolling_header = "Mean of {}".format(rolling)
+        summary_header = ["Category", "Total", "Share", "Mean", "P50", "P90", "Max"]
+
+        if format == "csv":
+            writer = csv.writer(out)
+            writer.writerow(["Start", "Total", rolling_header, "Change"] + self.category_names)
+            for index, period_start in enumerate(period_starts):
+                writer.writerow(
+                    [period_start.isoformat(), format_cents(period_totals[index])]
+                    + [format_cents(rolling_means[index]), format_cents(changes[index])]
+                    + [format_cents(cents) for cents in totals[index]]
+                )
+            out.write("\n")
+            writer.writerow(summary_header)
+            for category_name, total, share, mean, percentiles, maximum in summary:
+                writer.writerow(
+                    [category_name, format_cents(total), "{:.4f}".format(share), format_cents(mean)]
+                    + [format_cents(percentiles[50]), format_cents(percentiles[90]), format_cents(maximum)]
+                )
+            return
+
+        top_category_ids = totals.argmax(axis=1)
+        row_format = "{:<12}{:>14}{:>14}{:>14}  {}\n"
+        out.write(row_format.format("Start", "Total", rolling_header, "Change", "Top category"))
+        for index, period_start in enumerate(period_starts):
+            total = period_totals[index]
+            out.write(
+                row_format.format(
+                    period_start.isoformat(),
+                    format_cents(total),
+                    format_cents(rolling_means[index]),
+                    "{:+.2f}".format(changes[index] / 100),
+                    self.category_names[top_category_ids[index]] if total else "",
+                )
+            )
+        name_width = max([len("Category")] + [len(row[0]) for row in summary]) + 2
+        summary_format = "{:<" + str(name_width) + "}{:>14}{:>8}{:>12}{:>12}{:>12}{:>14}\n"
+        out.write("\n")
+        out.write(summary_format.format(*summary_header))
+        for category_name, total, share, mean, percentiles, maximum in summary:
+            out.write(
+                summary_format.format(
+                    category_name,
+                    format_cents(total),
+                    "{:.1%}".format(share),
+                    format_cents(mean),
+                    format_cents(percentiles[50]),
+                    format_cents(percentiles[90]),
+                    format_cents(maximum),
+                )
+            )
+
+
+def format_cents(cents):
+    return "{:.2f}".format(cents / 100)
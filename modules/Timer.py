@@ -19,6 +19,9 @@ class Timer:
             return(True)
         return(False)
 
+    def get_time_remaining(self):
+        return max(self.expiry_time - time.time(), 0)
+
     def start(self):
         self.start_time = time.time()
 
@@ -0,0 +1,153 @@
+from array import array
+from datetime import date, datetime, timedelta, timezone
+import pytz
+
+MICROSECONDS_PER_WEEK = 7 * 86400 * 1000000
+_epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_one_microsecond_delta = timedelta(microseconds=1)
+
+
+class WeekCalendar:
+    """
+    Works out where weeks begin and end in a timezone, for weeks starting on
+    a configurable day. The boundaries of each week are computed once and
+    memoised, and timestamps in microseconds since the epoch can be mapped
+    to their week in constant time.
+
+    Weeks are identified by the proleptic ordinal (date.toordinal()) of
+    their first day.
+    """
+    WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+    def __init__(self, tz="Pacific/Auckland", week_start_day=0):
+        if isinstance(tz, str):
+            tz = pytz.timezone(tz)
+        if isinstance(week_start_day, str):
+            week_start_day = WeekCalendar.WEEKDAY_NAMES.index(week_start_day.lower())
+        self.timezone = tz
+        self.week_start_day = week_start_day  # 0 is Monday
+        self._weeks = {}  # week ordinal -> (start of week, end of week)
+        self._boundaries = array("q")  # starts of consecutive weeks, in microseconds since the epoch
+        self._first_week = None  # ordinal of the week starting at _boundaries[0]
+
+    @property
+    def key(self):
+        """
+        A string identifying how this calendar divides time into weeks
+        """
+        return "{} {}".format(self.timezone.zone, self.week_start_day)
+
+    def localize(self, dt):
+        return self.timezone.localize(dt)
+
+    def now(self):
+        return datetime.now(tz=self.timezone)
+
+    def get_local_date(self, dt):
+        """
+        Returns the date dt falls on in this calendar's timezone. Naive
+        datetimes are taken to already be in local time.
+        """
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(self.timezone)
+        return dt.date()
+
+    def get_week_ordinal(self, day):
+        return day.toordinal() - (day.weekday() - self.week_start_day) % 7
+
+    def get_week_bounds(self, week_ordinal):
+        """
+        Returns the first and last instants of a week as aware datetimes
+        """
+        try:
+            return self._weeks[week_ordinal]
+        except KeyError:
+            week_start = self._get_start_of_day(week_ordinal)
+            week_end = self.timezone.normalize(self._get_start_of_day(week_ordinal + 7) - _one_microsecond_delta)
+            bounds = self._weeks[week_ordinal] = (week_start, week_end)
+            return bounds
+
+    def get_start_of_date(self, day):
+        """
+        Returns the first instant of a date in this calendar's timezone
+        """
+        return self._get_start_of_day(day.toordinal())
+
+    def _get_start_of_day(self, ordinal):
+        midnight = datetime.combine(date.fromordinal(ordinal), datetime.min.time())
+        try:
+            return self.timezone.localize(midnight, is_dst=None)
+        except pytz.AmbiguousTimeError:
+            # clocks went back over midnight, the day starts at the first one
+            return self.timezone.localize(midnight, is_dst=True)
+        except pytz.NonExistentTimeError:
+            # clocks went forward over midnight, the day starts when they land
+            return self.timezone.normalize(self.timezone.localize(midnight, is_dst=False))
+
+    def get_week_ordinal_for_datetime(self, dt):
+        if dt.tzinfo is None:
+            return self.get_week_ordinal(dt.date())
+        # cheaper than converting dt to this timezone
+        return self.get_week_ordinal_for_timestamp((dt - _epoch) // _one_microsecond_delta)
+
+    def get_week_start(self, dt):
+        return self.get_week_bounds(self.get_week_ordinal_for_datetime(dt))[0]
+
+    def get_week_end(self, dt):
+        return self.get_week_bounds(self.get_week_ordinal_for_datetime(dt))[1]
+
+    def get_month_bounds(self, dt):
+        """
+        Returns the first and last instants of the calendar month dt falls in
+        """
+        local_date = self.get_local_date(dt)
+        month_start = local_date.replace(day=1)
+        next_month_start = (month_start + timedelta(days=31)).replace(day=1)
+        month_end = self._get_start_of_day(next_month_start.toordinal()) - _one_microsecond_delta
+        return self._get_start_of_day(month_start.toordinal()), self.timezone.normalize(month_end)
+
+    def get_week_ordinal_for_timestamp(self, timestamp):
+        """
+        Returns the ordinal of the week containing a timestamp given in
+        microseconds since the epoch
+        """
+        boundaries = self._boundaries
+        if not boundaries or timestamp < boundaries[0] or timestamp >= boundaries[-1]:
+            self._extend_boundaries(timestamp)
+            boundaries = self._boundaries
+        index = min((timestamp - boundaries[0]) // MICROSECONDS_PER_WEEK, len(boundaries) - 2)
+        # weeks containing a DST change aren't exactly seven days long, so the estimate can be out by one
+        while boundaries[index] > timestamp:
+            index -= 1
+        while boundaries[index + 1] <= timestamp:
+            index += 1
+        return self._first_week + 7 * index
+
+    def get_week_start_for_timestamp(self, timestamp):
+        return self.get_week_bounds(self.get_week_ordinal_for_timestamp(timestamp))[0]
+
+    def _extend_boundaries(self, timestamp):
+        local_date = (_epoch + timedelta(microseconds=timestamp)).astimezone(self.timezone).date()
+        week = self.get_week_ordinal(local_date)
+        if not self._boundaries:
+            self._boundaries = self._get_boundaries(week, week + 7)
+            self._first_week = week
+            return
+        first_week = self._first_week
+        end_week = self._first_week + 7 * (len(self._boundaries) - 1)
+        # extend by a year at a time so scanning a ledger doesn't grow the array one week at a time
+        if week < first_week:
+            new_first_week = min(week, first_week - 52 * 7)
+            self._boundaries = self._get_boundaries(new_first_week, first_week - 7) + self._boundaries
+            self._first_week = new_first_week
+        if week >= end_week:
+            self._boundaries.extend(self._get_boundaries(end_week + 7, max(week + 7, end_week + 52 * 7)))
+
+    def _get_boundaries(self, first_week, last_week):
+        return array(
+            "q",
+            (
+                (self._get_start_of_day(ordinal) - _epoch) // _one_microsecond_delta
+                for ordinal in range(first_week, last_week + 1, 7)
+            ),
+        )
@@ -0,0 +1,77 @@
+from array import array
+from . import datetime_tools
+from .Price import Price
+
+
+class WeeklyTotals:
+    """
+    Running spending totals keyed by the start of the week and then by
+    category name. Built once from a ledger and kept up to date as
+    purchases are added, so that looking up a week is a dictionary access.
+    """
+    def __init__(self, purchases=()):
+        self.weeks = {}
+        for purchase in purchases:
+            self.add_purchase(purchase)
+
+    def get_week_start(self, time_created):
+        return datetime_tools.get_start_of_week(time_created)
+
+    def add_purchase(self, purchase):
+        week_start = self.get_week_start(purchase.time_created)
+        self.add(week_start, purchase.category_name, purchase.cost.cents)
+
+    def add(self, week_start, category_name, cents):
+        try:
+            category_totals = self.weeks[week_start]
+        except KeyError:
+            category_totals = self.weeks[week_start] = {}
+        try:
+            category_totals[category_name].cents += cents
+        except KeyError:
+            category_totals[category_name] = Price.from_cents(cents)
+
+    def drop_before(self, week_start):
+        """
+        Forgets the totals of every week starting before week_start
+        """
+        self.weeks = {start: category_totals for start, category_totals in self.weeks.items() if start >= week_start}
+
+    def get_category_totals(self, week_start):
+        """
+        Returns a dictionary mapping category names to the Price spent in
+        the week starting at week_start. Do not modify the result.
+        """
+        return self.weeks.get(week_start, {})
+
+    def to_columns(self, get_category_id):
+        """
+        Returns the totals as three arrays: the start of each week in
+        microseconds since the epoch, the category's id as given by
+        get_category_id and the total in cents
+        """
+        week_starts, category_ids, costs = array("q"), array("I"), array("q")
+        for week_start, category_totals in self.weeks.items():
+            timestamp = datetime_tools.to_microseconds(week_start)
+            for category_name, cost in category_totals.items():
+                week_starts.append(timestamp)
+                category_ids.append(get_category_id(category_name))
+                costs.append(cost.cents)
+        return week_starts, category_ids, costs
+
+    @classmethod
+    def from_columns(cls, week_starts, category_ids, costs, category_names):
+        """
+        Reverses to_columns(). Weeks are resolved through the current
+        datetime_tools.week_calendar.
+        """
+        weekly_totals = cls()
+        get_week_start = datetime_tools.week_calendar.get_week_start_for_timestamp
+        previous_timestamp = None
+        for timestamp, category_id, cents in zip(week_starts, category_ids, costs):
+            # to_columns() writes each week's totals together
+            if timestamp != previous_timestamp:
+                previous_timestamp = timestamp
+                category_totals = weekly_totals.weeks.setdefault(get_week_start(timestamp), {})
+            category_totals[category_names[category_id]] = Price.from_cents(cents)
+        return weekly_totals
@@ -1,9 +1,21 @@
+from .BackgroundWriter import BackgroundWriter
+from .BudgetTracker import BudgetTracker
 from .Category import Category
 from .CategoryList import CategoryList
 from .CSVImporter import CSVImporter
+from .ImportHistory import ImportHistory
+from .ImportProfile import ImportProfile
+from .LedgerServer import LedgerServer
+from .LedgerWatcher import LedgerWatcher
 from . import datetime_tools
+from .Price import Price
+from .Profiler import Profiler
 from .PurchaseList import PurchaseList
+from .ColumnarPurchaseList import ColumnarPurchaseList
 from .Timer import Timer
+from .WeekCalendar import WeekCalendar
+from .WeeklyTotals import WeeklyTotals
 from .PriceTextBuffer import PriceTextBuffer
+from . import storage
 
 from .widgets import *
\ No newline at end of file
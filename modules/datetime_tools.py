@@ -1,22 +1,73 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import pytz
+from .WeekCalendar import WeekCalendar
 
 def get_start_of_week(date):
-    dt = date - timedelta(days=date.weekday())
-    dt = datetime.combine(dt.date(), datetime.min.time())
-    return localize_datetime(dt)
+    return week_calendar.get_week_start(date)
 
 def get_end_of_week(date):
-    return get_start_of_week(date) + one_week_delta - timedelta(seconds=1)
+    return week_calendar.get_week_end(date)
+
+def get_start_of_previous_week(date):
+    """
+    Returns the start of the week before the one date falls in. Weeks
+    holding a DST change aren't seven days long, so this steps by calendar
+    week rather than subtracting a timedelta.
+    """
+    return get_start_of_week(get_start_of_week(date) - timedelta(days=1))
+
+def get_start_of_next_week(date):
+    return get_start_of_week(get_end_of_week(date) + one_microsecond_delta)
+
+def get_start_of_month(date):
+    return week_calendar.get_month_bounds(date)[0]
+
+def get_end_of_month(date):
+    return week_calendar.get_month_bounds(date)[1]
 
 def is_within_period(date, start_date, end_date):
     return start_date <= date <= end_date
 
 def now():
-    return datetime.now(tz=nz_tz)
+    return week_calendar.now()
 
 def localize_datetime(dt):
-    return nz_tz.localize(dt)
+    return week_calendar.localize(dt)
+
+def parse_local_time(text):
+    """
+    Parses an ISO 8601 time, taking times without a UTC offset to be in
+    local time. Raises ValueError if text isn't one.
+    """
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = localize_datetime(dt)
+    return dt
+
+def set_week_calendar(new_week_calendar):
+    """
+    Changes the timezone and week start day used throughout pyrite. Must be
+    called before any purchases are loaded.
+    """
+    global week_calendar
+    week_calendar = new_week_calendar
+
+def to_microseconds(dt):
+    """
+    Converts an aware datetime to microseconds since the epoch
+    """
+    return (dt - epoch) // one_microsecond_delta
+
+def from_microseconds(microseconds, utc_offset):
+    """
+    Converts microseconds since the epoch to an aware datetime with a fixed
+    UTC offset, given in seconds
+    """
+    try:
+        tzinfo = _fixed_offset_timezones[utc_offset]
+    except KeyError:
+        tzinfo = _fixed_offset_timezones[utc_offset] = timezone(timedelta(seconds=utc_offset))
+    return (epoch + timedelta(microseconds=microseconds)).astimezone(tzinfo)
 
 def get_human_readable_string(dt):
     date_with_suffix = get_date_with_suffix(dt)
@@ -34,6 +85,10 @@ def get_date_with_suffix(dt):
         day_suffix = "rd"
     return date+day_suffix
 
+epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+one_microsecond_delta = timedelta(microseconds=1)
 one_week_delta = timedelta(days=7)
 one_year_delta = timedelta(days=365)
-nz_tz = pytz.timezone("Pacific/Auckland")
\ No newline at end of file
+nz_tz = pytz.timezone("Pacific/Auckland")
+week_calendar = WeekCalendar(nz_tz)
+_fixed_offset_timezones = {}
\ No newline at end of file
@@ -0,0 +1,392 @@
+import csv
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from ..Price import Price
+from .FileLock import FileLock
+from .LedgerSnapshot import LedgerSnapshot
+from .Storage import Storage, synchronised
+
+
+class CSVStorage(Storage):
+    """
+    Keeps purchases and categories in human-readable csv files. Loads are
+    served through a LedgerSnapshot kept next to the purchases file. Writes
+    to the purchases file hold a FileLock, and after a load, load_changes()
+    picks up rows other processes have written since.
+    """
+    supports_snapshots = True
+    TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+    CSV_HEADER = "Timestamp,Category,Cost"
+    CATEGORIES_HEADER = ["name", "examples", "budget"]
+
+    def __init__(self, purchases_file_path=None, categories_file_path=None):
+        super().__init__()
+        self.purchases_file_path = purchases_file_path
+        self.categories_file_path = categories_file_path
+        # what is known of the purchases file, for load_changes()
+        self._watched_stat = None  # (inode, size, mtime) when last checked
+        self._read_offset = 0  # every row before this offset is in memory
+        self._read_tail = b""  # the bytes just before _read_offset
+        self._own_spans = []  # (start, end) offsets of rows written here that are past _read_offset
+
+    @property
+    def snapshot_file_path(self):
+        return self.purchases_file_path + ".snapshot"
+
+    @property
+    def lock_file_path(self):
+        return self.purchases_file_path + ".lock"
+
+    def load_purchases(self):
+        return read_csv_rows(self.purchases_file_path)
+
+    @synchronised
+    def load_snapshot(self):
+        """
+        Returns (snapshot, rows, source). snapshot is the LedgerSnapshot of
+        the purchases file, or None if there isn't a usable one, and rows
+        holds the purchases the snapshot is missing: those appended since it
+        was taken, or every purchase if there's no snapshot. source is the
+        (size, mtime, digest) of the file contents the two describe together.
+        """
+        with FileLock(self.lock_file_path, exclusive=False):
+            if not os.path.exists(self.purchases_file_path):
+                self._watch(None, None)
+                return None, [], None
+            with open(self.purchases_file_path, "rb") as purchases_file:
+                stat_result = os.fstat(purchases_file.fileno())
+                self._watch(purchases_file, stat_result)
+                return self._load_snapshot(purchases_file, stat_result)
+
+    def _load_snapshot(self, purchases_file, stat_result):
+        snapshot = LedgerSnapshot.load(self.snapshot_file_path)
+        if snapshot is not None and snapshot.describes(stat_result):
+            return snapshot, [], snapshot.source
+        hasher = hashlib.blake2b(digest_size=LedgerSnapshot.DIGEST_SIZE)
+        purchases_file.seek(0)
+        if snapshot is not None and snapshot.source[0] <= stat_result.st_size:
+            # rows appended since the snapshot was taken can be parsed on their own
+            for block in _read_blocks(purchases_file, snapshot.source[0], hasher):
+                pass
+            if hasher.digest() != snapshot.source[2]:
+                snapshot = None
+        else:
+            snapshot = None
+        if snapshot is None:
+            purchases_file.seek(0)
+            hasher = hashlib.blake2b(digest_size=LedgerSnapshot.DIGEST_SIZE)
+        lines = _split_lines(_read_blocks(purchases_file, stat_result.st_size - purchases_file.tell(), hasher))
+        if snapshot is None:
+            next(lines, None)  # header
+        rows = [parse_csv_line(line) for line in (line.decode().strip() for line in lines) if line]
+        return snapshot, rows, (stat_result.st_size, stat_result.st_mtime_ns, hasher.digest())
+
+    @synchronised
+    def load_purchases_between(self, start_time=None, end_time=None):
+        """
+        Reads the rows in a range from the snapshot, so older weeks can be
+        paged in without parsing the whole file. Only rows appended since
+        the snapshot was taken are parsed.
+        """
+        with FileLock(self.lock_file_path, exclusive=False):
+            if not os.path.exists(self.purchases_file_path):
+                return []
+            with open(self.purchases_file_path, "rb") as purchases_file:
+                snapshot, rows, _ = self._load_snapshot(purchases_file, os.fstat(purchases_file.fileno()))
+        rows = [
+            row
+            for row in rows
+            if (start_time is None or start_time <= row[0]) and (end_time is None or row[0] < end_time)
+        ]
+        if snapshot is not None:
+            rows.extend(snapshot.get_rows_between(start_time, end_time))
+        return rows
+
+    @synchronised
+    def save_snapshot(self, snapshot):
+        snapshot.save(self.snapshot_file_path)
+
+    @synchronised
+    def load_changes(self):
+        """
+        Checks whether the purchases file has changed since it was loaded
+        with load_snapshot() or last checked. Returns None if it hasn't,
+        (False, rows) with the rows other processes have appended to it, or
+        (True, None) if it was rewritten and has to be loaded again. Rows
+        written through this CSVStorage are never returned.
+        """
+        if self._watched_stat is None:
+            return None
+        try:
+            stat_result = os.stat(self.purchases_file_path)
+        except FileNotFoundError:
+            stat_result = None
+        # most checks end here, without opening the file
+        if _get_watched_stat(stat_result) == self._watched_stat:
+            return None
+        with FileLock(self.lock_file_path, exclusive=False):
+            if not os.path.exists(self.purchases_file_path):
+                rewritten = self._read_offset > 0
+                self._watch(None, None)
+                return (True, None) if rewritten else None
+            with open(self.purchases_file_path, "rb") as purchases_file:
+                stat_result = os.fstat(purchases_file.fileno())
+                if self._is_rewritten(purchases_file, stat_result):
+                    self._watch(purchases_file, stat_result)
+                    return True, None
+                rows = self._read_appended_rows(purchases_file, stat_result)
+        return False, rows
+
+    def _watch(self, purchases_file, stat_result):
+        """
+        Records that every row in purchases_file is in memory
+        """
+        self._watched_stat = _get_watched_stat(stat_result)
+        self._own_spans = []
+        if purchases_file is None:
+            self._read_offset = 0
+            self._read_tail = b""
+        else:
+            self._read_offset = stat_result.st_size
+            self._read_tail = _read_tail(purchases_file, stat_result.st_size)
+
+    def _is_rewritten(self, purchases_file, stat_result):
+        if self._read_offset == 0:
+            return False
+        if stat_result.st_ino != self._watched_stat[0] or stat_result.st_size < self._read_offset:
+            return True
+        # a file edited in place keeps its inode, so check the end of what was read is still there
+        return _read_tail(purchases_file, self._read_offset) != self._read_tail
+
+    def _read_appended_rows(self, purchases_file, stat_result):
+        start = self._read_offset
+        purchases_file.seek(start)
+        data = purchases_file.read(stat_result.st_size - start)
+        # a row still being written by a process that doesn't lock is left for the next check
+        end = start + data.rfind(b"\n") + 1
+        own_spans = self._own_spans
+        rows = []
+        line_start = start
+        for line in data[: end - start].split(b"\n")[:-1]:
+            is_own = any(span_start <= line_start < span_end for span_start, span_end in own_spans)
+            is_header = line_start == 0
+            line_start += len(line) + 1
+            if is_own or is_header:
+                continue
+            try:
+                line = line.decode().strip()
+                if line:
+                    time_created, category_name, cost = parse_csv_line(line)
+                    rows.append((time_created, category_name, Price(cost)))
+            except (ValueError, IndexError, OverflowError):
+                # the read offset still moves past it, so rows appended after it are picked up
+                self.skipped_rows += 1
+        if end > start:
+            self._read_offset = end
+            self._read_tail = _read_tail(purchases_file, end)
+            self._own_spans = [span for span in own_spans if span[1] > end]
+        if end == stat_result.st_size:
+            self._watched_stat = _get_watched_stat(stat_result)
+        return rows
+
+    @staticmethod
+    def format_csv_line(purchase):
+        return ",".join(
+            [
+                purchase.time_created.strftime(CSVStorage.TIMESTAMP_FORMAT),
+                purchase.category_name,
+                str(float(purchase.cost)),
+            ]
+        )
+
+    @synchronised
+    def write_purchases(self, purchases):
+        """
+        Writes every purchase to the csv file. The file is written to a
+        temporary path first and renamed over the original, so an
+        interrupted write never leaves a truncated ledger behind.
+        """
+        temporary_file_path = self.purchases_file_path + ".tmp"
+        with FileLock(self.lock_file_path):
+            with open(temporary_file_path, "w") as purchases_file:
+                purchases_file.write(CSVStorage.CSV_HEADER + "\n")
+                for purchase in purchases:
+                    purchases_file.write(self.format_csv_line(purchase) + "\n")
+                purchases_file.flush()
+                os.fsync(purchases_file.fileno())
+            os.replace(temporary_file_path, self.purchases_file_path)
+            if self._watched_stat is not None:
+                with open(self.purchases_file_path, "rb") as purchases_file:
+                    self._watch(purchases_file, os.fstat(purchases_file.fileno()))
+        # the snapshot is rebuilt the next time the ledger is loaded
+        if os.path.exists(self.snapshot_file_path):
+            os.remove(self.snapshot_file_path)
+
+    @synchronised
+    def append_purchases(self, purchases):
+        """
+        Appends purchases to the end of the csv file without rewriting the
+        rows already in it, creating the file if it doesn't exist.
+        """
+        lines = [(self.format_csv_line(purchase) + "\n").encode() for purchase in purchases]
+        prefix = b""
+        with FileLock(self.lock_file_path), open(self.purchases_file_path, "ab+") as purchases_file:
+            file_size = purchases_file.seek(0, os.SEEK_END)
+            if file_size == 0:
+                prefix = (CSVStorage.CSV_HEADER + "\n").encode()
+            else:
+                purchases_file.seek(-1, os.SEEK_END)
+                if purchases_file.read(1) != b"\n":
+                    prefix = b"\n"
+            stat_result = os.fstat(purchases_file.fileno())
+            # rows in memory and on disk still match unless another process has written since the last check
+            watched_stat = self._watched_stat
+            unchanged = (
+                watched_stat is not None
+                and self._read_offset == file_size
+                and (_get_watched_stat(stat_result) == watched_stat or (file_size == 0 and watched_stat[0] is None))
+            )
+            purchases_file.write(prefix + b"".join(lines))
+            purchases_file.flush()
+            os.fsync(purchases_file.fileno())
+            stat_result = os.fstat(purchases_file.fileno())
+            if watched_stat is not None:
+                if unchanged:
+                    self._watch(purchases_file, stat_result)
+                else:
+                    self._own_spans.append((file_size + len(prefix), stat_result.st_size))
+
+    def load_categories(self):
+        with open(self.categories_file_path, "r") as csv_file:
+            reader = csv.reader(csv_file, delimiter=",")
+            reader.__next__()
+            # the budget column is optional
+            return [(line[0], line[1], line[2] if len(line) > 2 else "") for line in reader]
+
+    def write_categories(self, categories):
+        temporary_file_path = self.categories_file_path + ".tmp"
+        with open(temporary_file_path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file, lineterminator="\n")
+            writer.writerow(CSVStorage.CATEGORIES_HEADER)
+            for category in categories:
+                writer.writerow([category.name, category.hint, category.budget_text])
+        os.replace(temporary_file_path, self.categories_file_path)
+
+
+READ_BLOCK_SIZE = 1 << 20  # characters
+_utc_offsets = {}
+
+
+def parse_timestamp(text):
+    """
+    Parses a timestamp in CSVStorage.TIMESTAMP_FORMAT. Timestamps laid out
+    exactly as pyrite writes them (2021-03-04T09:15:00.000000+1300) take a
+    fast path, anything else falls back to strptime.
+    """
+    if len(text) == 31 and text[10] == "T" and text[19] == "." and text[26] in "+-":
+        try:
+            # Python 3.11+ parses this layout natively
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+        try:
+            tzinfo = _utc_offsets[text[26:]]
+        except KeyError:
+            tzinfo = None
+            if text[27:].isdigit():
+                offset = timedelta(hours=int(text[27:29]), minutes=int(text[29:31]))
+                tzinfo = _utc_offsets[text[26:]] = timezone(-offset if text[26] == "-" else offset)
+        if tzinfo is not None:
+            try:
+                return datetime(
+                    int(text[0:4]),
+                    int(text[5:7]),
+                    int(text[8:10]),
+                    int(text[11:13]),
+                    int(text[14:16]),
+                    int(text[17:19]),
+                    int(text[20:26]),
+                    tzinfo,
+                )
+            except ValueError:
+                pass
+    return datetime.strptime(text, CSVStorage.TIMESTAMP_FORMAT)
+
+
+def read_csv_rows(purchases_file_path):
+    """
+    Yields (time_created, category_name, cost) for each row in a purchases
+    csv file, skipping the header. The file is read in large blocks and rows
+    are split on commas directly, with quoted rows handed to the csv module.
+    """
+    with open(purchases_file_path, "r") as csv_file:
+        lines = _read_lines(csv_file)
+        next(lines, None)
+        for line in lines:
+            if line:
+                yield parse_csv_line(line)
+
+
+def parse_csv_line(line):
+    """
+    Parses one line of a purchases csv file into a
+    (time_created, category_name, cost) row
+    """
+    fields = line.split(",")
+    if len(fields) != 3 or '"' in line:
+        fields = next(csv.reader([line]))
+    return parse_timestamp(fields[0]), fields[1], fields[2]
+
+
+TAIL_LENGTH = 64  # bytes compared to tell an appended file from a rewritten one
+
+
+def _get_watched_stat(stat_result):
+    if stat_result is None:
+        return (None, 0, None)
+    return (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def _read_tail(binary_file, end):
+    start = max(end - TAIL_LENGTH, 0)
+    binary_file.seek(start)
+    return binary_file.read(end - start)
+
+
+def _read_blocks(binary_file, length, hasher=None):
+    """
+    Yields the next length bytes of a file in blocks, adding each to hasher
+    if one is given
+    """
+    while length > 0:
+        block = binary_file.read(min(READ_BLOCK_SIZE, length))
+        if not block:
+            break
+        length -= len(block)
+        if hasher is not None:
+            hasher.update(block)
+        yield block
+
+
+def _split_lines(blocks):
+    remainder = b""
+    for block in blocks:
+        lines = (remainder + block).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def _read_lines(text_file):
+    remainder = ""
+    while True:
+        block = text_file.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        lines = (remainder + block).split("\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
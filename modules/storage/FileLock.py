@@ -0,0 +1,36 @@
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where files go unlocked
+    fcntl = None
+
+
+class FileLock:
+    """
+    An advisory lock on a file, shared between processes with flock(), so
+    that two pyrite instances or a script using this class don't write to
+    a ledger at the same time. Use as a context manager. Exclusive locks
+    are for writers, shared locks for readers.
+    """
+    def __init__(self, lock_file_path, exclusive=True):
+        self.lock_file_path = lock_file_path
+        self.exclusive = exclusive
+        self._lock_file = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        self._lock_file = open(self.lock_file_path, "a")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        except BaseException:
+            self._lock_file.close()
+            self._lock_file = None
+            raise
+        return self
+
+    def __exit__(self, *exception_info):
+        if self._lock_file is not None:
+            # closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
@@ -0,0 +1,167 @@
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+import sys
+from .. import datetime_tools
+from ..Price import Price
+
+
+class LedgerSnapshot:
+    """
+    Binary copy of a parsed ledger, kept next to a purchases csv file so it
+    doesn't have to be parsed again on every start. Holds the purchase
+    columns of a ColumnarPurchaseList, the category names they refer to and
+    the weekly category totals, together with the size, modification time
+    and digest of the csv file it was made from.
+    """
+    MAGIC = b"PYRSNAP1"
+    # magic, byte order, source size, source mtime, source digest, row count,
+    # weekly total count, category names length, calendar key length
+    HEADER = struct.Struct("<8sc7xqq32sqqqq")
+    DIGEST_SIZE = 32
+
+    def __init__(
+        self,
+        timestamps,
+        utc_offsets,
+        category_ids,
+        costs,
+        category_names,
+        week_starts,
+        week_category_ids,
+        week_costs,
+        calendar_key,
+        source=None,
+    ):
+        self.timestamps = timestamps
+        self.utc_offsets = utc_offsets
+        self.category_ids = category_ids
+        self.costs = costs
+        self.category_names = category_names
+        self.week_starts = week_starts  # microseconds since the epoch
+        self.week_category_ids = week_category_ids
+        self.week_costs = week_costs
+        self.calendar_key = calendar_key  # weekly totals are only valid for the calendar they were made with
+        self.source = source  # (size, mtime in nanoseconds, digest) of the csv file
+
+    def describes(self, stat_result):
+        return self.source is not None and self.source[:2] == (stat_result.st_size, stat_result.st_mtime_ns)
+
+    def get_rows_between(self, start_time=None, end_time=None):
+        """
+        Returns (time_created, category_name, cost) rows for the purchases
+        made from start_time up to but not including end_time, found with a
+        binary search since the purchases are in time order
+        """
+        timestamps = self.timestamps
+        start_index = 0
+        if start_time is not None:
+            start_index = bisect_left(timestamps, datetime_tools.to_microseconds(start_time))
+        end_index = len(timestamps)
+        if end_time is not None:
+            end_index = bisect_left(timestamps, datetime_tools.to_microseconds(end_time))
+        category_names = self.category_names
+        return [
+            (
+                datetime_tools.from_microseconds(timestamps[index], self.utc_offsets[index]),
+                category_names[self.category_ids[index]],
+                Price.from_cents(self.costs[index]),
+            )
+            for index in range(start_index, end_index)
+        ]
+
+    @classmethod
+    def load(cls, snapshot_file_path):
+        """
+        Reads a snapshot written by save() through a memory map. Returns
+        None if there isn't one or it can't be read.
+        """
+        try:
+            with open(snapshot_file_path, "rb") as snapshot_file:
+                with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as snapshot_map:
+                    with memoryview(snapshot_map) as view:
+                        return cls._read(view)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return None
+
+    @classmethod
+    def _read(cls, view):
+        (
+            magic,
+            byte_order,
+            source_size,
+            source_mtime,
+            source_digest,
+            row_count,
+            week_count,
+            names_length,
+            calendar_key_length,
+        ) = cls.HEADER.unpack_from(view)
+        if magic != cls.MAGIC or byte_order != sys.byteorder[0].encode():
+            return None
+        position = cls.HEADER.size
+
+        def read_bytes(length):
+            nonlocal position
+            if position + length > len(view):
+                raise ValueError("snapshot is truncated")
+            data = view[position : position + length]
+            position += length
+            return data
+
+        def read_array(typecode, count):
+            values = array(typecode)
+            with read_bytes(count * values.itemsize) as data:
+                values.frombytes(data)
+            return values
+
+        with read_bytes(names_length) as data:
+            category_names = bytes(data).decode().split("\0") if names_length else []
+        with read_bytes(calendar_key_length) as data:
+            calendar_key = bytes(data).decode()
+        return cls(
+            read_array("q", row_count),
+            read_array("i", row_count),
+            read_array("I", row_count),
+            read_array("q", row_count),
+            category_names,
+            read_array("q", week_count),
+            read_array("I", week_count),
+            read_array("q", week_count),
+            calendar_key,
+            (source_size, source_mtime, source_digest),
+        )
+
+    def save(self, snapshot_file_path):
+        names = "\0".join(self.category_names).encode()
+        calendar_key = self.calendar_key.encode()
+        source_size, source_mtime, source_digest = self.source
+        header = LedgerSnapshot.HEADER.pack(
+            LedgerSnapshot.MAGIC,
+            sys.byteorder[0].encode(),
+            source_size,
+            source_mtime,
+            source_digest,
+            len(self.timestamps),
+            len(self.week_starts),
+            len(names),
+            len(calendar_key),
+        )
+        temporary_file_path = snapshot_file_path + ".tmp"
+        with open(temporary_file_path, "wb") as snapshot_file:
+            snapshot_file.write(header)
+            snapshot_file.write(names)
+            snapshot_file.write(calendar_key)
+            for values in (
+                self.timestamps,
+                self.utc_offsets,
+                self.category_ids,
+                self.costs,
+                self.week_starts,
+                self.week_category_ids,
+                self.week_costs,
+            ):
+                values.tofile(snapshot_file)
+        os.replace(temporary_file_path, snapshot_file_path)
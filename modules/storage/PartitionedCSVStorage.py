@@ -0,0 +1,145 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from .CSVStorage import CSVStorage, parse_csv_line, read_csv_rows
+from .Storage import Storage, synchronised
+
+
+class PartitionedCSVStorage(Storage):
+    """
+    Keeps purchases in one csv file per year (2024.csv) or per month
+    (2024-03.csv) inside a directory, so that appending a purchase touches
+    only the active partition, range loads read only the partitions they
+    overlap, and rewrites leave unchanged partitions alone. Purchases are
+    partitioned by the local date they were recorded on. An existing
+    single-file ledger is split into partitions the first time the
+    directory is used, and renamed with a .migrated suffix.
+    """
+    PARTITION_FORMATS = {"year": "%Y", "month": "%Y-%m"}
+
+    def __init__(self, directory, categories_file_path=None, granularity="year", legacy_file_path=None):
+        super().__init__()
+        if granularity not in PartitionedCSVStorage.PARTITION_FORMATS:
+            raise ValueError(
+                "Partition granularity must be one of: " + ", ".join(PartitionedCSVStorage.PARTITION_FORMATS)
+            )
+        self.directory = directory
+        self.categories_file_path = categories_file_path
+        self.partition_format = PartitionedCSVStorage.PARTITION_FORMATS[granularity]
+        self._partitions = {}
+        os.makedirs(directory, exist_ok=True)
+        existing_keys = self.get_partition_keys()
+        key_length = len(self.get_partition_key_for_time(datetime(2000, 1, 1)))
+        if any(len(key) != key_length for key in existing_keys):
+            raise ValueError("{} holds partitions of a different granularity than {}".format(directory, granularity))
+        if legacy_file_path is not None and os.path.exists(legacy_file_path) and not existing_keys:
+            self.migrate_single_file(legacy_file_path)
+
+    def get_partition_key_for_time(self, time_created):
+        return time_created.strftime(self.partition_format)
+
+    def get_partition_keys(self):
+        keys = [name[:-4] for name in os.listdir(self.directory) if name.endswith(".csv")]
+        return sorted(keys)
+
+    def get_partition(self, key):
+        try:
+            return self._partitions[key]
+        except KeyError:
+            partition = self._partitions[key] = CSVStorage(os.path.join(self.directory, key + ".csv"))
+            return partition
+
+    def migrate_single_file(self, legacy_file_path):
+        """
+        Splits a single-file ledger into partitions, copying each line
+        unchanged, then renames the original out of the way
+        """
+        partition_files = {}
+        try:
+            with open(legacy_file_path, "r") as legacy_file:
+                legacy_file.readline()  # header
+                for line in legacy_file:
+                    if not line.strip():
+                        continue
+                    key = self.get_partition_key_for_time(parse_csv_line(line.strip())[0])
+                    try:
+                        partition_file = partition_files[key]
+                    except KeyError:
+                        temporary_file_path = self.get_partition(key).purchases_file_path + ".tmp"
+                        partition_file = partition_files[key] = open(temporary_file_path, "w")
+                        partition_file.write(CSVStorage.CSV_HEADER + "\n")
+                    partition_file.write(line if line.endswith("\n") else line + "\n")
+        finally:
+            for partition_file in partition_files.values():
+                partition_file.flush()
+                os.fsync(partition_file.fileno())
+                partition_file.close()
+        for key in partition_files:
+            partition_file_path = self.get_partition(key).purchases_file_path
+            os.replace(partition_file_path + ".tmp", partition_file_path)
+        os.replace(legacy_file_path, legacy_file_path + ".migrated")
+
+    def _group_by_partition(self, purchases):
+        partitions = {}
+        for purchase in purchases:
+            partitions.setdefault(self.get_partition_key_for_time(purchase.time_created), []).append(purchase)
+        return partitions
+
+    def load_purchases(self):
+        for key in self.get_partition_keys():
+            yield from read_csv_rows(self.get_partition(key).purchases_file_path)
+
+    @synchronised
+    def load_purchases_between(self, start_time=None, end_time=None):
+        # partitions follow local dates, so look one day either side of the range
+        first_key = None if start_time is None else self.get_partition_key_for_time(start_time - timedelta(days=1))
+        last_key = None if end_time is None else self.get_partition_key_for_time(end_time + timedelta(days=1))
+        rows = []
+        for key in self.get_partition_keys():
+            if (first_key is not None and key < first_key) or (last_key is not None and key > last_key):
+                continue
+            for row in read_csv_rows(self.get_partition(key).purchases_file_path):
+                if (start_time is None or start_time <= row[0]) and (end_time is None or row[0] < end_time):
+                    rows.append(row)
+        return rows
+
+    @synchronised
+    def append_purchases(self, purchases):
+        for key, partition_purchases in self._group_by_partition(purchases).items():
+            self.get_partition(key).append_purchases(partition_purchases)
+
+    @synchronised
+    def write_purchases(self, purchases):
+        """
+        Replaces the stored ledger with purchases, rewriting only the
+        partitions whose contents would change
+        """
+        partitions = self._group_by_partition(purchases)
+        for key in self.get_partition_keys():
+            if key not in partitions:
+                os.remove(self.get_partition(key).purchases_file_path)
+        for key, partition_purchases in partitions.items():
+            partition = self.get_partition(key)
+            lines = [CSVStorage.CSV_HEADER]
+            lines.extend(CSVStorage.format_csv_line(purchase) for purchase in partition_purchases)
+            new_digest = hashlib.blake2b("".join(line + "\n" for line in lines).encode()).digest()
+            if _get_file_digest(partition.purchases_file_path) != new_digest:
+                partition.write_purchases(partition_purchases)
+
+    def load_categories(self):
+        return CSVStorage(categories_file_path=self.categories_file_path).load_categories()
+
+    def write_categories(self, categories):
+        CSVStorage(categories_file_path=self.categories_file_path).write_categories(categories)
+
+
+def _get_file_digest(file_path):
+    digest = hashlib.blake2b()
+    try:
+        with open(file_path, "rb") as digest_file:
+            for block in iter(lambda: digest_file.read(1 << 20), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.digest()
+
@@ -0,0 +1,112 @@
+import sqlite3
+from .. import datetime_tools
+from ..Price import Price
+from .Storage import Storage, synchronised
+
+
+class SQLiteStorage(Storage):
+    """
+    Keeps purchases and categories in a SQLite database. Purchases are
+    indexed by timestamp, so loading a range of weeks is answered by the
+    database without reading the rest of the ledger.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY,
+            timestamp INTEGER NOT NULL,
+            utc_offset INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            cents INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS purchases_by_timestamp ON purchases (timestamp);
+        CREATE TABLE IF NOT EXISTS categories (
+            position INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            hint TEXT NOT NULL DEFAULT '',
+            budget TEXT NOT NULL DEFAULT ''
+        );
+    """
+
+    def __init__(self, database_path):
+        super().__init__()
+        self.database_path = database_path
+        # the connection is shared with the background writer thread, calls are serialised on self.lock
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SQLiteStorage.SCHEMA)
+        # databases made before budgets were added don't have the column
+        category_columns = [row[1] for row in self.connection.execute("PRAGMA table_info(categories)")]
+        if "budget" not in category_columns:
+            self.connection.execute("ALTER TABLE categories ADD COLUMN budget TEXT NOT NULL DEFAULT ''")
+        # nothing looks purchases up by category, so older databases stop maintaining that index
+        self.connection.execute("DROP INDEX IF EXISTS purchases_by_category")
+
+    @synchronised
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _to_row(time_created, category_name, cents):
+        utc_offset = int(time_created.utcoffset().total_seconds())
+        return datetime_tools.to_microseconds(time_created), utc_offset, category_name, cents
+
+    @staticmethod
+    def _from_row(timestamp, utc_offset, category_name, cents):
+        return datetime_tools.from_microseconds(timestamp, utc_offset), category_name, Price.from_cents(cents)
+
+    @synchronised
+    def load_purchases(self):
+        cursor = self.connection.execute(
+            "SELECT timestamp, utc_offset, category, cents FROM purchases ORDER BY timestamp, id"
+        )
+        return [self._from_row(*row) for row in cursor]
+
+    @synchronised
+    def load_purchases_between(self, start_time=None, end_time=None):
+        conditions = []
+        parameters = []
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(datetime_tools.to_microseconds(start_time))
+        if end_time is not None:
+            conditions.append("timestamp < ?")
+            parameters.append(datetime_tools.to_microseconds(end_time))
+        query = "SELECT timestamp, utc_offset, category, cents FROM purchases"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        cursor = self.connection.execute(query + " ORDER BY timestamp, id", parameters)
+        return [self._from_row(*row) for row in cursor]
+
+    @synchronised
+    def append_purchases(self, purchases):
+        rows = [
+            self._to_row(purchase.time_created, purchase.category_name, purchase.cost.cents) for purchase in purchases
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO purchases (timestamp, utc_offset, category, cents) VALUES (?, ?, ?, ?)", rows
+            )
+
+    @synchronised
+    def write_purchases(self, purchases):
+        rows = (
+            self._to_row(purchase.time_created, purchase.category_name, purchase.cost.cents) for purchase in purchases
+        )
+        with self.connection:
+            self.connection.execute("DELETE FROM purchases")
+            self.connection.executemany(
+                "INSERT INTO purchases (timestamp, utc_offset, category, cents) VALUES (?, ?, ?, ?)", rows
+            )
+
+    @synchronised
+    def load_categories(self):
+        return self.connection.execute("SELECT name, hint, budget FROM categories ORDER BY position").fetchall()
+
+    @synchronised
+    def write_categories(self, categories):
+        with self.connection:
+            self.connection.execute("DELETE FROM categories")
+            self.connection.executemany(
+                "INSERT INTO categories (name, hint, budget) VALUES (?, ?, ?)",
+                [(category.name, category.hint, category.budget_text) for category in categories],
+            )
@@ -0,0 +1,70 @@
+import functools
+import threading
+
+
+def synchronised(method):
+    """
+    Serialises calls to a Storage method on the storage's lock, so that a
+    BackgroundWriter thread and the interface can share one Storage.
+    """
+    @functools.wraps(method)
+    def synchronised_method(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return synchronised_method
+
+
+class Storage:
+    """
+    Interface between PurchaseList/CategoryList and wherever their data is
+    kept. Purchases are loaded as (time_created, category_name, cost) rows,
+    categories as (name, hint, budget) rows, with budgets written as text
+    (see Category.parse_budget).
+    """
+    supports_snapshots = False  # see CSVStorage.load_snapshot
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.skipped_rows = 0  # rows load_changes() found but couldn't read
+
+    def load_purchases(self):
+        raise NotImplementedError
+
+    def load_purchases_between(self, start_time=None, end_time=None):
+        """
+        Returns the rows for purchases made from start_time up to but not
+        including end_time. Either bound may be None to leave that side
+        open. Backends that can read part of the ledger should override it.
+        """
+        return [
+            row
+            for row in self.load_purchases()
+            if (start_time is None or start_time <= row[0]) and (end_time is None or row[0] < end_time)
+        ]
+
+    def append_purchases(self, purchases):
+        """
+        Durably adds purchases to the stored ledger
+        """
+        raise NotImplementedError
+
+    def write_purchases(self, purchases):
+        """
+        Replaces the stored ledger with purchases
+        """
+        raise NotImplementedError
+
+    def load_changes(self):
+        """
+        Returns None if the stored ledger hasn't been changed by another
+        process since it was loaded, (False, rows) with the rows that were
+        appended to it, or (True, None) if it has to be loaded again.
+        Appended rows that can't be read are skipped and counted in
+        skipped_rows. Backends that can't tell always return None.
+        """
+        return None
+
+    def load_categories(self):
+        raise NotImplementedError
+
+    def write_categories(self, categories):
+        raise NotImplementedError
@@ -0,0 +1,6 @@
+from .Storage import Storage
+from .LedgerSnapshot import LedgerSnapshot
+from .CSVStorage import CSVStorage
+from .PartitionedCSVStorage import PartitionedCSVStorage
+from .SQLiteStorage import SQLiteStorage
+from .migrate import migrate
@@ -0,0 +1,10 @@
+def migrate(source, destination):
+    """
+    Copies every category and purchase from one Storage to another,
+    replacing whatever the destination held.
+    """
+    from ..CategoryList import CategoryList
+    from ..PurchaseList import PurchaseList
+
+    destination.write_categories(CategoryList.from_storage(source))
+    destination.write_purchases(PurchaseList.from_storage(source))
@@ -2,9 +2,31 @@ from swm.widgets import Menu
 
 
 class CategoryMenu(Menu):
+    """
+    Menu over a CategoryList that can be narrowed down by typing part of a
+    category's name
+    """
+    def __init__(self, category_list):
+        self.category_list = category_list
+        self.filter_text = ""
+        super().__init__(list(category_list.categories))
+
+    def set_filter_text(self, filter_text):
+        """
+        Shows only the categories matching filter_text and selects the best
+        match. Returns False, leaving the menu unchanged, if nothing matches.
+        """
+        contents = self.category_list.search(filter_text)
+        if not contents:
+            return False
+        self.filter_text = filter_text
+        self.contents = contents
+        self.pointer = 0
+        return True
+
     def _convert_item_to_string(self, item):
-        length = len(max(self.contents, key=len))
-        return (" " + str(item)).ljust(length + 2)
+        # the width of the longest name in the whole list, so filtering doesn't resize the menu
+        return (" " + str(item)).ljust(self.category_list.max_name_length + 2)
 
     def _convert_selected_item_to_string(self, item):
         return self._convert_item_to_string(item)
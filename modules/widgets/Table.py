@@ -2,13 +2,30 @@ from swm.components import Screen, Point, Border
 
 
 class Table:
+    """
+    A grid of rows under column headers. Only the rows that fit on screen
+    are rendered, starting from scroll_offset, so rows may be any sequence,
+    including one that builds each row only when it's asked for.
+    """
     def __init__(self, column_headers):
         self.columns = []
         for header in column_headers:
             self.add_column(header)
         self.clear_rows()
         self.theme = Border.NORMAL
-        self.highlighted_cells = []
+        self.highlighted_cells = set()
+        self.scroll_offset = 0  # index of the first row shown
+        self._column_layout_key = None
+        self._column_layout = None
+
+    @property
+    def highlighted_cells(self):
+        return self._highlighted_cells
+
+    @highlighted_cells.setter
+    def highlighted_cells(self, cells):
+        # a set of (column index, row index) pairs, for a constant time check per cell
+        self._highlighted_cells = set(cells)
 
     def clear_rows(self):
         self.rows = []
@@ -33,44 +50,64 @@ class Table:
         else:
             self.rows.append([*args])
 
-    def _render_sequence_over_columns(self, sequence, row_index, render_screen):
-        proportional_unit_size = self._get_proportional_unit_size(render_screen.width, allow_space_for_grid=True)
-        x_offset = 0
-        for column_index, column in enumerate(self.columns):
-            column_width = column.get_width(proportional_unit_size)
+    @staticmethod
+    def get_visible_row_count(height):
+        return max(height - 2, 0)  # the headers take two lines
+
+    def scroll(self, row_count, height):
+        """
+        Moves the view by row_count rows, staying within the table when it
+        is rendered at the given height
+        """
+        last_offset = max(len(self.rows) - self.get_visible_row_count(height), 0)
+        self.scroll_offset = min(max(self.scroll_offset + row_count, 0), last_offset)
+
+    def _get_column_layout(self, screen_width):
+        """
+        Returns the (x offset, width) of each column. The layout is kept
+        until the screen width or a column's sizing changes.
+        """
+        column_sizes = tuple((column.proportional_width, column.minimum_width) for column in self.columns)
+        layout_key = (screen_width, column_sizes)
+        if layout_key != self._column_layout_key:
+            proportional_unit_size = self._get_proportional_unit_size(screen_width, allow_space_for_grid=True)
+            self._column_layout = []
+            x_offset = 0
+            for column in self.columns:
+                column_width = column.get_width(proportional_unit_size)
+                self._column_layout.append((x_offset, column_width))
+                x_offset += column_width + 1
+            self._column_layout_key = layout_key
+        return self._column_layout
+
+    def _render_sequence_over_columns(self, sequence, screen_row, render_screen, row_index=None):
+        last_column_index = len(self.columns) - 1
+        for column_index, (x_offset, column_width) in enumerate(self._get_column_layout(render_screen.width)):
             try:
                 item = str(sequence[column_index])
             except IndexError:
                 item = ""
-            highlight = False
-            for cell in self.highlighted_cells:
-                if cell[0] == column_index and cell[1] == row_index - 2:
-                    highlight = True
-            render_screen.draw((x_offset + 1, row_index), item, reverse=highlight)
-            if column != self.columns[-1]:
-                render_screen.draw((x_offset + column_width, row_index), self.theme[Border.VERTICAL])
-            x_offset += column_width + 1
+            highlight = (column_index, row_index) in self._highlighted_cells
+            render_screen.draw((x_offset + 1, screen_row), item, reverse=highlight)
+            if column_index != last_column_index:
+                render_screen.draw((x_offset + column_width, screen_row), self.theme[Border.VERTICAL])
 
     def _render_row(self, row, row_index, render_screen):
-        self._render_sequence_over_columns(row, row_index, render_screen)
+        self._render_sequence_over_columns(row, row_index - self.scroll_offset + 2, render_screen, row_index)
 
     def _render_headers(self, render_screen):
         self._render_sequence_over_columns(self.get_headers(), 0, render_screen)
 
-        proportional_unit_size = self._get_proportional_unit_size(render_screen.width, allow_space_for_grid=True)
-        i = 0
-        for column in self.columns:
-            column_width = column.get_width(proportional_unit_size)
-            if column == self.columns[-1]:
+        last_column_index = len(self.columns) - 1
+        for column_index, (x_offset, column_width) in enumerate(self._get_column_layout(render_screen.width)):
+            if column_index == last_column_index:
                 # prevent offscreen intersection from showing in some circumstances
-                render_screen.draw((0 + i, 1), self.theme[Border.HORIZONTAL] * column_width * 2)
+                render_screen.draw((x_offset, 1), self.theme[Border.HORIZONTAL] * column_width * 2)
             else:
                 render_screen.draw(
-                    (0 + i, 1), self.theme[Border.HORIZONTAL] * column_width + self.theme[Border.INTERSECTION]
+                    (x_offset, 1), self.theme[Border.HORIZONTAL] * column_width + self.theme[Border.INTERSECTION]
                 )
 
-            i += column_width + 1
-
     def render_to_window(self, window, offset=(0, 0)):
         rendered_menu = self.render(window.screen.width, window.screen.height)
         window.draw(offset, rendered_menu)
@@ -79,8 +116,11 @@ class Table:
         render_screen = Screen(width, height)
         self._render_headers(render_screen)
 
-        for index, row in enumerate(self.rows):
-            self._render_row(row, index + 2, render_screen)
+        rows = self.rows
+        first_row = min(self.scroll_offset, len(rows))
+        last_row = min(first_row + self.get_visible_row_count(height), len(rows))
+        for index in range(first_row, last_row):
+            self._render_row(rows[index], index, render_screen)
         return render_screen
 
     def _get_proportional_unit_size(self, screen_width, allow_space_for_grid=False):
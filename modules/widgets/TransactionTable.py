@@ -0,0 +1,47 @@
+from .Table import Table
+
+
+class TransactionTable(Table):
+    """
+    Table listing individual purchases, oldest first. Rows are formatted
+    only when they scroll into view, so a period with tens of thousands of
+    purchases renders as quickly as one with ten.
+    """
+    TIME_FORMAT = "%a %d %b %H:%M"
+
+    def __init__(self):
+        super().__init__(["Time", "Category", "Cost"])
+        time_column = self.get_column("Time")
+        time_column.minimum_width = 18
+        category_column = self.get_column("Category")
+        category_column.proportional_width = 2
+        cost_column = self.get_column("Cost")
+        cost_column.minimum_width = 10
+
+    def set_purchases(self, purchases):
+        """
+        Lists purchases, which may be any sequence of Purchase objects such
+        as a PurchaseListView, and scrolls back to the top
+        """
+        self.rows = PurchaseRows(purchases)
+        self.scroll_offset = 0
+
+
+class PurchaseRows:
+    """
+    A read-only sequence of table rows built on demand from a sequence of
+    purchases
+    """
+    def __init__(self, purchases):
+        self.purchases = purchases
+
+    def __len__(self):
+        return len(self.purchases)
+
+    def __getitem__(self, index):
+        purchase = self.purchases[index]
+        return (
+            purchase.time_created.strftime(TransactionTable.TIME_FORMAT),
+            purchase.category_name,
+            str(purchase.cost),
+        )
@@ -1,2 +1,3 @@
 from .CategoryMenu import CategoryMenu
 from .Table import Table
+from .TransactionTable import TransactionTable
@@ -1,41 +1,171 @@
-from modules import CategoryList, CategoryMenu, PriceTextBuffer, Timer, PurchaseList, Table, datetime_tools
+from modules import (
+    BackgroundWriter,
+    BudgetTracker,
+    CategoryList,
+    CategoryMenu,
+    ColumnarPurchaseList,
+    CSVImporter,
+    ImportHistory,
+    ImportProfile,
+    LedgerServer,
+    LedgerWatcher,
+    PriceTextBuffer,
+    Profiler,
+    WeekCalendar,
+    Timer,
+    Price,
+    Table,
+    TransactionTable,
+    datetime_tools,
+)
+from modules.PriceTextBuffer import parse_price_text
+from modules.PurchaseList import Purchase
+from modules.storage import CSVStorage, PartitionedCSVStorage, SQLiteStorage, migrate
+import argparse
+import asyncio
+import csv
 import os
+import select
 import sys
 import time
-from datetime import datetime
 import string
+import pytz
 from swm import silica, Key
-
-silica.setup()
+from swm.components import Screen
 
 project_path = os.path.dirname(os.path.realpath(__file__))
 categories_path = os.path.join(project_path, "data/categories.csv")
 spending_data_path = os.path.join(project_path, "data/spending_data.csv")
+database_path = os.path.join(project_path, "data/pyrite.sqlite3")
+partitions_path = os.path.join(project_path, "data/spending")
+import_history_path = os.path.join(project_path, "data/import_history.txt")
+profile_report_path = os.path.join(project_path, "data/profile.txt")
+
+
+def get_storage(storage_type, partition_by="year"):
+    if storage_type == "sqlite":
+        return SQLiteStorage(database_path)
+    if storage_type == "partitioned":
+        return PartitionedCSVStorage(
+            partitions_path, categories_path, partition_by, legacy_file_path=spending_data_path
+        )
+    return CSVStorage(spending_data_path, categories_path)
 
 
 class Program:
-    def __init__(self):
+    OVERVIEW_TITLES = {
+        "totals": "Overview",
+        "week": "Purchases this week",
+        "month": "Purchases this month",
+    }
+
+    def __init__(self, storage=None, history_weeks=None, profiler=None):
+        if storage is None:
+            storage = get_storage("csv")
+        if profiler is None:
+            profiler = Profiler(enabled=False)
+        self.profiler = profiler
         self.initialise_windows()
         self.initialise_overview_table()
+        self.transaction_table = TransactionTable()
+        self.overview_mode = "totals"
 
-        self.category_list = CategoryList.from_csv(categories_path)
-        self.category_menu = CategoryMenu(self.category_list.categories)
+        self.category_list = CategoryList.from_storage(storage)
+        self.category_menu = CategoryMenu(self.category_list)
+        self.collapsed_groups = set()
         self.textbuffer = PriceTextBuffer()
 
         self.example_text_timer = Timer(3)
         self.standby_timer = Timer(5)
+        self.ledger_check_timer = Timer(1)  # how often to look for changes made by other processes
         self.reset_time_pointer_to_now()
-
-        self.purchase_list = PurchaseList.from_csv(spending_data_path)
+        self.current_week_end = None
+        self.overview_theme = None
+
+        # only recent weeks are loaded up front, older weeks are paged in when viewed
+        window_start = None
+        if history_weeks is not None:
+            window_start = self.time_pointer
+            for _ in range(history_weeks - 1):
+                window_start = datetime_tools.get_start_of_previous_week(window_start)
+        self.purchase_list = ColumnarPurchaseList.from_storage(storage, window_start)
+        self.writer = BackgroundWriter(self.purchase_list)
+        self.ledger_watcher = LedgerWatcher(self.purchase_list, self.writer)
+        self.save_error = None
+        self.budget_tracker = BudgetTracker(self.category_list, self.purchase_list)
+        self.alert = None  # shown in place of the selected week until the next key press
+        self.over_budget_cells = []
+        if self.budget_tracker:
+            self.overview_table.add_column("Left", minimum_width=10)
+        self.profiler.instrument(self, "populate_overview_table", "update_table_highlight", "draw_subtotals")
+        self.profiler.instrument(self.overview_table, "render")
+        self.profiler.instrument(self.transaction_table, "render")
+        self.profiler.instrument(self.category_menu, "render")
+        self.instrument_purchase_list()
         self.populate_overview_table()
         self.update_table_highlight()
 
+        # windows are only re-rendered when the state they depend on changes
+        self.window_renderers = {
+            "categories": self.render_category_menu,
+            "overview": self.render_overview,
+            "cost": self.render_text_buffer,
+            "time": self.render_selected_week,
+            "examples": self.render_examples,
+        }
+        if self.profiler.enabled:
+            self.window_renderers["profile"] = self.render_profile
+        self.window_screens = {}
+        self.invalidated_windows = set()
+        self.invalidate_all()
+
+    def instrument_purchase_list(self):
+        self.profiler.instrument(
+            self.purchase_list, "get_purchases_within_time_period", "add_purchase", "ensure_loaded"
+        )
+
+    def load_ledger_changes(self):
+        """
+        Brings the purchase list up to date with purchases other processes
+        have written to the ledger, loading it again if it was rewritten
+        """
+        try:
+            added, skipped_rows = self.ledger_watcher.check()
+        except (OSError, ValueError):
+            return  # tried again at the next check
+        if skipped_rows:
+            self.alert = "Skipped {} unreadable rows in the ledger".format(skipped_rows)
+            self.invalidate("time")
+        if self.ledger_watcher.reload_pending:
+            try:
+                self.purchase_list = self.ledger_watcher.reload()
+            except Exception as e:
+                # the reload is tried again at the next check
+                self.save_error = e
+                self.invalidate("time")
+                return
+            self.budget_tracker.purchase_list = self.purchase_list
+            self.instrument_purchase_list()
+        elif not added:
+            return
+        self.budget_tracker.clear()
+        self.refresh_overview()
+        self.invalidate("overview")
+
+    def invalidate(self, *window_names):
+        self.invalidated_windows.update(window_names)
+
+    def invalidate_all(self):
+        self.invalidate(*self.window_renderers)
+
     def initialise_windows(self):
         silica.add_window((0, 0, 22, -4), "categories").set_title("Categories")
         silica.add_window((22, 0, -1, -4), "overview").set_title("Overview")
         silica.add_window((0, -3, 22, -1), "cost").set_title("Enter cost")
         silica.add_window((22, -3, -1, -1), "time").set_title("\u2190 Selected week \u2192")
         silica.add_centered_window((38, 3), "examples").set_title("Examples")
+        if self.profiler.enabled:
+            silica.add_window((-36, 0, -1, 3), "profile").set_title("Profile")
 
     def initialise_overview_table(self):
         self.overview_table = Table(["Category", "Total"])
@@ -47,33 +177,113 @@ class Program:
 
     def populate_overview_table(self):
         self.overview_table.clear_rows()
-        category_totals = self.get_purchases_in_selected_week().group_purchases_by_category()
-        category_totals_names = [purchase.category_name for purchase in category_totals]
-
-        for category in self.category_list:
-            if category.name in category_totals_names:
-                for purchase in category_totals:
-                    if purchase.category_name == category.name:
-                        cost = purchase.cost
-                row = (category.name, str(cost))
-                self.overview_table.add_row(row)
+        self.overview_rows = {}  # (category name, whether it's the group row) -> row number
+        self.over_budget_cells = []
+        category_totals = self.get_category_totals_in_selected_week()
+        group_totals = self.category_list.get_group_totals(category_totals)
+
+        for category in self.category_list.walk(self.collapsed_groups):
+            indent = "  " * category.depth
+            if category.name in group_totals:
+                collapsed = category.name in self.collapsed_groups
+                marker = "+ " if collapsed else "- "
+                label = indent + marker + category.short_name
+                self.add_overview_row((category.name, True), label, group_totals[category.name])
+                if collapsed:
+                    continue
+            if category.name in category_totals:
+                label = indent + "  " + category.short_name
+                self.add_overview_row((category.name, False), label, category_totals[category.name])
+
+    def add_overview_row(self, row_key, label, total):
+        row_index = self.overview_rows[row_key] = len(self.overview_table.rows)
+        category_name, is_group_row = row_key
+        remaining = None
+        # a budget covers everything under its category, so it goes on the group row if there is one
+        if self.budget_tracker and (is_group_row or (category_name, True) not in self.overview_rows):
+            remaining = self.budget_tracker.get_remaining(category_name, self.time_pointer)
+        if remaining is None:
+            self.overview_table.add_row((label, str(total)))
+            return
+        self.overview_table.add_row((label, str(total), format_signed_price(remaining)))
+        if remaining.cents < 0:
+            self.over_budget_cells.append((2, row_index))
 
     def update_table_highlight(self):
-        category_totals = self.get_purchases_in_selected_week().group_purchases_by_category()
-        category_totals_names = [purchase.category_name for purchase in category_totals]
-
-        category_totals_names_sorted = []
-        for category in self.category_list:
-            if category.name in category_totals_names:
-                category_totals_names_sorted.append(category.name)
-
         selected_cat = self.category_menu.selected_item.name
-        try:
-            row_number = category_totals_names_sorted.index(selected_cat)
-        except ValueError:
-            self.overview_table.highlighted_cells = []
+        # a category inside a collapsed group is highlighted through the group's row
+        row_keys = [(selected_cat, False)] + [
+            (group_name, True)
+            for group_name in reversed(self.category_list.get_ancestor_names(selected_cat))
+            if group_name in self.collapsed_groups
+        ]
+        for row_key in row_keys:
+            if row_key in self.overview_rows:
+                self.overview_table.highlighted_cells = [(1, self.overview_rows[row_key])] + self.over_budget_cells
+                return
+        self.overview_table.highlighted_cells = self.over_budget_cells
+
+    def get_selected_group_name(self):
+        """
+        Returns the name of the group the selected category heads, or else
+        the one it belongs to
+        """
+        selected_category = self.category_menu.selected_item
+        if selected_category.children:
+            return selected_category.name
+        return selected_category.parent_name
+
+    def set_group_collapsed(self, collapsed):
+        group_name = self.get_selected_group_name()
+        if group_name is None:
             return
-        self.overview_table.highlighted_cells = [(1, row_number)]
+        if collapsed:
+            self.collapsed_groups.add(group_name)
+        else:
+            self.collapsed_groups.discard(group_name)
+        self.populate_overview_table()
+        self.update_table_highlight()
+        self.invalidate("overview")
+
+    def refresh_overview(self):
+        self.populate_overview_table()
+        self.update_table_highlight()
+        if self.overview_mode != "totals":
+            self.populate_transaction_table()
+
+    def cycle_overview_mode(self):
+        """
+        Switches the overview window between category totals, the selected
+        week's purchases and the selected month's purchases
+        """
+        modes = list(Program.OVERVIEW_TITLES)
+        self.overview_mode = modes[(modes.index(self.overview_mode) + 1) % len(modes)]
+        silica.get_window("overview").set_title(Program.OVERVIEW_TITLES[self.overview_mode])
+        self.refresh_overview()
+        self.invalidate("overview", "time")
+
+    def get_selected_period(self):
+        """
+        Returns the start and end of the week, or in month mode the month,
+        that is being viewed
+        """
+        if self.overview_mode == "month":
+            return (
+                datetime_tools.get_start_of_month(self.time_pointer),
+                datetime_tools.get_end_of_month(self.time_pointer),
+            )
+        return datetime_tools.get_start_of_week(self.time_pointer), datetime_tools.get_end_of_week(self.time_pointer)
+
+    def populate_transaction_table(self):
+        period_start, period_end = self.get_selected_period()
+        self.purchase_list.ensure_loaded(period_start)
+        purchases = self.purchase_list.get_purchases_within_time_period(period_start, period_end)
+        self.transaction_table.set_purchases(purchases)
+        self.transaction_total = Price.sum(purchase.cost for purchase in purchases.group_purchases_by_category())
+
+    def get_transaction_table_height(self):
+        # the bottom line of the window is kept for the period's total
+        return silica.get_window("overview").screen.height - 1
 
     def get_purchases_in_selected_week(self):
         week_start = datetime_tools.get_start_of_week(self.time_pointer)
@@ -81,120 +291,523 @@ class Program:
         purchase_list = self.purchase_list.get_purchases_within_time_period(week_start, week_end)
         return purchase_list
 
-    def reset_time_pointer_to_now(self):
-        self.time_pointer = datetime_tools.get_start_of_week(datetime.now())
-
-    def draw_category_menu(self):
-        cat_window = silica.get_window("categories")
-        width = cat_window.screen.width
-        height = cat_window.screen.height
-        cat_screen = self.category_menu.render(width, height)
-        cat_window.draw((0, 0), cat_screen)
-
-    def draw_text_buffer(self):
-        cat_screen = silica.get_window("cost")
-        cat_screen.draw((1, 0), "$ " + self.textbuffer.get())
+    def get_category_totals_in_selected_week(self):
+        week_start = datetime_tools.get_start_of_week(self.time_pointer)
+        return self.purchase_list.weekly_totals.get_category_totals(week_start)
 
-    def draw_selected_week(self):
-        time_window = silica.get_window("time")
+    def reset_time_pointer_to_now(self):
+        self.time_pointer = datetime_tools.get_start_of_week(datetime_tools.now())
+
+    def render_category_menu(self, width, height):
+        return self.category_menu.render(width, height)
+
+    def render_overview(self, width, height):
+        if self.overview_mode != "totals":
+            return self.render_transactions(width, height)
+        overview_screen = self.overview_table.render(width, height)
+        self.draw_subtotals(overview_screen)
+        return overview_screen
+
+    def render_transactions(self, width, height):
+        transactions_screen = Screen(width, height)
+        transactions_screen.draw((0, 0), self.transaction_table.render(width, height - 1))
+        purchase_count = len(self.transaction_table.rows)
+        scroll_offset = self.transaction_table.scroll_offset
+        first_row = min(scroll_offset + 1, purchase_count)
+        last_row = min(scroll_offset + self.transaction_table.get_visible_row_count(height - 1), purchase_count)
+        summary = f"{first_row}-{last_row} of {purchase_count}   Total: ${float(self.transaction_total):.0f}"
+        transactions_screen.draw((max(width - len(summary) - 1, 0), height - 1), summary)
+        return transactions_screen
+
+    def render_text_buffer(self, width, height):
+        cost_screen = Screen(width, height)
+        cost_screen.draw((1, 0), "$ " + self.textbuffer.get())
+        return cost_screen
+
+    def render_selected_week(self, width, height):
+        time_screen = Screen(width, height)
+        if self.save_error is not None:
+            time_screen.draw((0, 0), ("Save failed: " + str(self.save_error)).center(width)[:width], reverse=True)
+            return time_screen
+        if self.alert is not None:
+            time_screen.draw((0, 0), self.alert.center(width)[:width], reverse=True)
+            return time_screen
+        if self.overview_mode == "month":
+            month_string = datetime_tools.get_start_of_month(self.time_pointer).strftime("%B %Y")
+            time_screen.draw((0, 0), month_string.center(width))
+            return time_screen
         date_string_1 = datetime_tools.get_human_readable_string(self.time_pointer)
         date_string_2 = datetime_tools.get_human_readable_string(datetime_tools.get_end_of_week(self.time_pointer))
         date_string = date_string_1 + " - " + date_string_2
-        time_window.draw((0, 0), date_string.center(time_window.screen.width))
+        time_screen.draw((0, 0), date_string.center(width))
+        return time_screen
 
-    def draw_subtotals(self):
-        food_spending = 0
-        total_spending = 0
+    def render_examples(self, width, height):
+        examples_screen = Screen(width, height)
+        hint = self.category_menu.selected_item.hint
+        examples_screen.draw((0, 0), hint.center(width))
+        return examples_screen
+
+    def render_profile(self, width, height):
+        profile_screen = Screen(width, height)
+        for y, line in enumerate(self.profiler.get_overlay_lines()):
+            profile_screen.draw((1, y), line[: width - 1])
+        return profile_screen
+
+    def draw_subtotals(self, overview_screen):
+        # group subtotals are rows of the overview table
+        category_totals = self.get_category_totals_in_selected_week()
+        total_spending = Price.sum(category_totals.values())
+        x = overview_screen.width - 12
+        y = overview_screen.height - 1
+        overview_screen.draw((x, y), f"Total: ${float(total_spending):.0f}")
+
+    def update_timed_state(self):
+        """
+        Invalidates windows whose appearance depends on the passage of time
+        rather than on a keypress.
+        """
+        save_error = self.writer.pop_error()
+        if save_error is not None:
+            self.save_error = save_error
+            self.invalidate("time")
+
+        if self.ledger_check_timer.is_expired():
+            self.ledger_check_timer.start()
+            with self.profiler.phase("load_ledger_changes"):
+                self.load_ledger_changes()
 
-        selected_purchases = self.get_purchases_in_selected_week()
-        for purchase in selected_purchases.purchases:
-            if purchase.category_name.startswith("Food: "):
-                food_spending += float(purchase.cost)
-            total_spending += float(purchase.cost)
-        overview_window = silica.get_window("overview")
-        overview_window.draw((-12, -2), f" Food: ${food_spending:.0f}")
-        overview_window.draw((-12, -1), f"Total: ${total_spending:.0f}")
+        examples_window = silica.get_window("examples")
+        examples_visible = not self.example_text_timer.is_expired()
+        if examples_window.visible != examples_visible:
+            examples_window.visible = examples_visible
+            self.invalidate("examples")
+
+        # Draw different border on overview window if on current week
+        now = datetime_tools.now()
+        if self.current_week_end is None or now > self.current_week_end:
+            self.current_week_start = datetime_tools.get_start_of_week(now)
+            self.current_week_end = datetime_tools.get_end_of_week(now)
+        if self.current_week_start <= self.time_pointer <= self.current_week_end:
+            overview_theme = "double"
+        else:
+            overview_theme = "normal"
+        if overview_theme != self.overview_theme:
+            self.overview_theme = overview_theme
+            silica.get_window("overview").set_theme(overview_theme)
+            self.invalidate("overview")
 
     def parse_keypress(self, key):
         if not key.is_empty():
             self.standby_timer.start()
+            if self.save_error is not None or self.alert is not None:
+                self.save_error = None
+                self.alert = None
+                self.invalidate("time")
 
-        if key == "q":
+        # q types into the category filter once one has been started
+        if key == "q" and not self.category_menu.filter_text:
             sys.exit()
-        if key == Key.UP:
-            self.category_menu.previous()
-            self.example_text_timer.start()
-            self.update_table_highlight()
-        if key == Key.DOWN:
-            self.category_menu.next()
-            self.example_text_timer.start()
-            self.update_table_highlight()
-        if key == Key.PAGEUP:
-            self.category_menu.pointer = 0
-            self.example_text_timer.start()
-            self.update_table_highlight()
-        if key == Key.PAGEDOWN:
-            self.category_menu.pointer = -1
-            self.example_text_timer.start()
-            self.update_table_highlight()
+        if (key == Key.PAGEUP or key == Key.PAGEDOWN) and self.overview_mode != "totals":
+            # page through the purchases instead of jumping through the menu
+            height = self.get_transaction_table_height()
+            page = self.transaction_table.get_visible_row_count(height)
+            self.transaction_table.scroll(-page if key == Key.PAGEUP else page, height)
+            self.invalidate("overview")
+        elif key == Key.UP or key == Key.DOWN or key == Key.PAGEUP or key == Key.PAGEDOWN:
+            if key == Key.UP:
+                self.category_menu.previous()
+            if key == Key.DOWN:
+                self.category_menu.next()
+            if key == Key.PAGEUP:
+                self.category_menu.pointer = 0
+            if key == Key.PAGEDOWN:
+                self.category_menu.pointer = -1
+            self.update_selected_category()
         if key == Key.LEFT:
-            self.time_pointer -= datetime_tools.one_week_delta
-            self.populate_overview_table()
-            self.update_table_highlight()
+            self.time_pointer = datetime_tools.get_start_of_previous_week(self.time_pointer)
+            self.purchase_list.ensure_loaded(self.time_pointer)
+            self.refresh_overview()
+            self.invalidate("overview", "time")
         if key == Key.RIGHT:
-            self.time_pointer += datetime_tools.one_week_delta
-            self.populate_overview_table()
-            self.update_table_highlight()
+            self.time_pointer = datetime_tools.get_start_of_next_week(self.time_pointer)
+            self.refresh_overview()
+            self.invalidate("overview", "time")
         if key == Key.ENTER:
             tb = self.textbuffer.get()
             if tb != "":
                 current_category = self.category_menu.selected_item
-                self.purchase_list.add_purchase(current_category.name, float(tb))
+                purchase = self.purchase_list.add_purchase(current_category.name, float(tb))
+                self.set_budget_alert(purchase, self.budget_tracker.add_purchase(purchase))
                 self.textbuffer.clear()
+                self.set_category_filter("")
                 self.reset_time_pointer_to_now()
-                self.populate_overview_table()
-                self.update_table_highlight()
-                self.purchase_list.save()
+                self.refresh_overview()
+                self.writer.save()
+                self.invalidate("overview", "cost", "time")
 
         if key.is_character():
-            self.textbuffer.add(str(key))
+            character = str(key)
+            if character == "-" or character == "+":
+                self.set_group_collapsed(character == "-")
+            elif character == "*":
+                self.cycle_overview_mode()
+            elif character in string.digits or character == ".":
+                self.textbuffer.add(character)
+                self.invalidate("cost")
+            else:
+                self.set_category_filter(self.category_menu.filter_text + character)
         if key == Key.BACKSPACE:
-            self.textbuffer.backspace()
+            if self.textbuffer.get() == "" and self.category_menu.filter_text:
+                self.set_category_filter(self.category_menu.filter_text[:-1])
+            else:
+                self.textbuffer.backspace()
+                self.invalidate("cost")
+
+        # unhandled keys (such as terminal resizes) redraw everything
+        if not key.is_empty() and not self.invalidated_windows:
+            self.invalidate_all()
+
+    def set_budget_alert(self, purchase, overspent_categories):
+        """
+        Warns about the budgets a purchase has just gone over
+        """
+        if not overspent_categories:
+            return
+        overspends = []
+        for category in overspent_categories:
+            remaining = self.budget_tracker.get_remaining(category.name, purchase.time_created)
+            overspends.append(
+                "{} by {} this {}".format(category.name, Price.from_cents(-remaining.cents), category.budget_period)
+            )
+        self.alert = "Over budget: " + ", ".join(overspends)
+
+    def update_selected_category(self):
+        self.example_text_timer.start()
+        self.update_table_highlight()
+        self.invalidate("categories", "overview", "examples")
+
+    def set_category_filter(self, filter_text):
+        """
+        Narrows the category menu to the categories matching filter_text.
+        Text that matches nothing is ignored.
+        """
+        if filter_text == self.category_menu.filter_text:
+            return
+        if self.category_menu.set_filter_text(filter_text):
+            title = "Find: " + filter_text if filter_text else "Categories"
+            silica.get_window("categories").set_title(title)
+            self.update_selected_category()
+
+    def get_time_until_next_event(self):
+        """
+        Returns the number of seconds until a running timer expires, the
+        current week ends, a pending write should be checked on or the ledger
+        should be checked for changes, whichever comes first.
+        """
+        timeouts = []
+        for timer in (self.example_text_timer, self.standby_timer, self.ledger_check_timer):
+            if not timer.is_expired():
+                timeouts.append(timer.get_time_remaining())
+        if self.current_week_end is not None:
+            timeouts.append((self.current_week_end - datetime_tools.now()).total_seconds())
+        if self.writer.has_pending_writes():
+            # check back soon so write errors are shown promptly
+            timeouts.append(0.1)
+        if not timeouts:
+            return None
+        # wake just after the deadline so the timer reads as expired
+        return max(min(timeouts), 0) + 0.01
+
+    def wait_for_event(self):
+        """
+        Blocks until there is input on stdin or the next timer deadline
+        passes.
+        """
+        select.select([sys.stdin], [], [], self.get_time_until_next_event())
 
     def main(self):
-        overview_window = silica.get_window("overview")
-        examples_window = silica.get_window("examples")
-        hint = self.category_menu.selected_item.hint
-        examples_window.draw((0, 0), hint.center(examples_window.screen.width))
-        examples_window.visible = not self.example_text_timer.is_expired()
-
+        """
+        Processes one keypress and redraws any windows that changed.
+        Returns True if a key was pressed.
+        """
+        frame_start_time = time.perf_counter()
         key = silica.get_keypress()
-        self.parse_keypress(key)
-
-        # Draw different border on overview window if on current week
-        start_time = datetime_tools.get_start_of_week(self.time_pointer)
-        end_time = datetime_tools.get_end_of_week(self.time_pointer)
-
-        if start_time <= datetime_tools.now() <= end_time:
-            overview_window.set_theme("double")
+        with self.profiler.phase("parse_keypress"):
+            self.parse_keypress(key)
+        with self.profiler.phase("update_timed_state"):
+            self.update_timed_state()
+        if not self.invalidated_windows:
+            return not key.is_empty()
+
+        if self.profiler.enabled:
+            # the overlay shows the frames before this one, so refresh it whenever anything is drawn
+            self.invalidate("profile")
+        for window_name in self.invalidated_windows:
+            window = silica.get_window(window_name)
+            render = self.window_renderers[window_name]
+            with self.profiler.phase(render.__name__):
+                self.window_screens[window_name] = render(window.screen.width, window.screen.height)
+        self.invalidated_windows.clear()
+
+        for window_name, window_screen in self.window_screens.items():
+            silica.get_window(window_name).draw((0, 0), window_screen)
+        with self.profiler.phase("silica.process"):
+            silica.process()
+        if self.profiler.enabled:
+            self.profiler.record_frame(time.perf_counter() - frame_start_time)
+        return not key.is_empty()
+
+
+def format_signed_price(price):
+    if price.cents < 0:
+        return "-" + str(Price.from_cents(-price.cents))
+    return str(price)
+
+
+def run_interface(storage, history_weeks, profile_file_path=None):
+    profiler = Profiler(enabled=profile_file_path is not None)
+    silica.setup()
+    program = None
+    try:
+        program = Program(storage, history_weeks, profiler)
+        while True:
+            # keep reading while keys are buffered, then sleep until the next event
+            if not program.main():
+                program.wait_for_event()
+    finally:
+        try:
+            # make sure every entered purchase reaches the disk before exiting
+            if program is not None:
+                program.writer.close()
+        finally:
+            silica.cleanup()
+            if profiler.enabled:
+                profiler.write_report(profile_file_path)
+
+
+def run_migrate(direction):
+    csv_storage = get_storage("csv")
+    sqlite_storage = get_storage("sqlite")
+    if direction == "csv-to-sqlite":
+        migrate(csv_storage, sqlite_storage)
+    else:
+        migrate(sqlite_storage, csv_storage)
+    print("Migrated {}".format(direction))
+
+
+def run_import(storage, arguments):
+    if arguments.profile is None:
+        profile = ImportProfile()
+    else:
+        profile = ImportProfile.from_json(arguments.profile)
+    category_names = set(CategoryList.from_storage(storage).get_names())
+    unknown_category_names = profile.get_category_names() - category_names
+    if unknown_category_names:
+        sys.exit("Unknown categories in import profile: " + ", ".join(sorted(unknown_category_names)))
+
+    # imported purchases are appended, so there's no need to keep old history in memory
+    window_start = datetime_tools.get_start_of_week(datetime_tools.now())
+    purchase_list = ColumnarPurchaseList.from_storage(storage, window_start)
+    importer = CSVImporter(arguments.file, profile=profile)
+    result = importer.import_into(
+        purchase_list, ImportHistory(import_history_path), workers=arguments.workers, dry_run=arguments.dry_run
+    )
+    print(result)
+    if result.invalid_lines:
+        shown_lines = ", ".join(str(line_number) for line_number in result.invalid_lines[:20])
+        if len(result.invalid_lines) > 20:
+            shown_lines += " and {} more".format(len(result.invalid_lines) - 20)
+        print("Skipped rows that couldn't be read on lines " + shown_lines, file=sys.stderr)
+
+
+def read_purchase_lines(lines, category_list):
+    """
+    Parses "category,cost[,time]" lines into Purchases. Returns the
+    purchases and a message for each line that couldn't be parsed.
+    """
+    purchases = []
+    errors = []
+    for line_number, fields in enumerate(csv.reader(lines), 1):
+        if not fields or not "".join(fields).strip():
+            continue
+        try:
+            if len(fields) not in (2, 3):
+                raise ValueError("expected category,cost or category,cost,time")
+            purchases.append(parse_purchase(category_list, *fields))
+        except (LookupError, ValueError) as e:
+            errors.append("line {}: {}".format(line_number, e))
+    return purchases, errors
+
+
+def parse_purchase(category_list, category_text, cost_text, time_text=None):
+    """
+    Makes a Purchase from text, finding the category by name or prefix and
+    checking the cost the same way the interface does
+    """
+    category = category_list.find_category(category_text.strip())
+    cost = parse_price_text(cost_text.strip())
+    time_created = None if time_text is None else datetime_tools.parse_local_time(time_text.strip())
+    return Purchase(category.name, cost, time_created)
+
+
+def run_add(storage, arguments):
+    category_list = CategoryList.from_storage(storage)
+    if arguments.category is None:
+        purchases, errors = read_purchase_lines(sys.stdin, category_list)
+    elif arguments.cost is None:
+        sys.exit("A cost is needed to add a purchase")
+    else:
+        try:
+            purchases = [parse_purchase(category_list, arguments.category, arguments.cost, arguments.time)]
+        except (LookupError, ValueError) as e:
+            sys.exit(str(e))
+        errors = []
+    if errors:
+        # nothing is written unless every purchase is valid
+        sys.exit("\n".join(errors))
+    if not purchases:
+        print("No purchases to add")
+        return
+    storage.append_purchases(purchases)
+    total = Price.sum(purchase.cost for purchase in purchases)
+    print("Added {} purchase{} totalling {}".format(len(purchases), "" if len(purchases) == 1 else "s", total))
+
+
+def run_report(storage, arguments):
+    # NumPy is only needed here, so it isn't imported when the interface starts
+    from modules.SpendingAnalytics import SpendingAnalytics
+
+    try:
+        analytics = SpendingAnalytics.from_purchase_list(ColumnarPurchaseList.from_storage(storage))
+    except ImportError as error:
+        sys.exit(str(error))
+    if not len(analytics):
+        sys.exit("No purchases to report on")
+    try:
+        analytics.format_report(sys.stdout, arguments.period, arguments.format, arguments.rolling, arguments.top)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader stopped early, as with `pyrite.py report | head`; point stdout at devnull so
+        # flushing it on exit doesn't fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+def run_serve(storage, arguments):
+    server = LedgerServer(ColumnarPurchaseList.from_storage(storage), CategoryList.from_storage(storage))
+
+    def on_start(listener):
+        if arguments.socket is None:
+            print("Serving on http://{}:{}".format(arguments.host, arguments.port))
         else:
-            overview_window.set_theme("normal")
-
-        self.overview_table.render_to_window(overview_window)
-        self.draw_category_menu()
-        self.draw_selected_week()
-        self.draw_text_buffer()
-        self.draw_subtotals()
-
-        silica.process()
-
-
-try:
-    program = Program()
-    while True:
-        program.main()
-except BaseException as e:
-    silica.cleanup()
-    raise e
-finally:
-    silica.cleanup()
+            print("Serving on " + arguments.socket)
+
+    try:
+        asyncio.run(server.serve(arguments.host, arguments.port, arguments.socket, on_start))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Pyrite personal spending tracker")
+    parser.add_argument(
+        "--storage",
+        choices=["csv", "partitioned", "sqlite"],
+        default="csv",
+        help="where spending data is kept (default: csv)",
+    )
+    parser.add_argument(
+        "--partition-by",
+        choices=["year", "month"],
+        default="year",
+        help="how partitioned storage splits up the ledger (default: year)",
+    )
+    parser.add_argument(
+        "--history-weeks",
+        type=int,
+        default=12,
+        help="number of recent weeks to load at startup, older weeks are loaded when viewed (default: 12)",
+    )
+    parser.add_argument("--load-all", action="store_true", help="load the whole ledger at startup")
+    parser.add_argument(
+        "--profile",
+        dest="profile_interface",
+        action="store_true",
+        help="time each part of the interface, showing frame times as it runs and writing a report on exit",
+    )
+    parser.add_argument(
+        "--profile-output",
+        default=profile_report_path,
+        help="where --profile writes its report (default: data/profile.txt)",
+    )
+    parser.add_argument(
+        "--timezone",
+        default="Pacific/Auckland",
+        help="timezone that weeks are counted in (default: Pacific/Auckland)",
+    )
+    parser.add_argument(
+        "--week-start",
+        choices=WeekCalendar.WEEKDAY_NAMES,
+        default="monday",
+        help="day that weeks start on (default: monday)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    migrate_parser = subparsers.add_parser("migrate", help="copy all data from one storage backend to the other")
+    migrate_parser.add_argument("direction", choices=["csv-to-sqlite", "sqlite-to-csv"])
+    import_parser = subparsers.add_parser("import", help="import purchases from a bank export csv file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--profile", help="json file describing the export's columns and category rules")
+    import_parser.add_argument("--workers", type=int, default=1, help="processes to parse the file with")
+    import_parser.add_argument("--dry-run", action="store_true", help="report what would be imported")
+    report_parser = subparsers.add_parser("report", help="print spending statistics over the whole ledger")
+    report_parser.add_argument(
+        "--period", choices=["week", "month", "year"], default="month", help="period to total by (default: month)"
+    )
+    report_parser.add_argument(
+        "--format", choices=["text", "csv"], default="text", help="output format (default: text)"
+    )
+    report_parser.add_argument(
+        "--rolling", type=int, default=3, help="number of periods in the rolling mean (default: 3)"
+    )
+    report_parser.add_argument("--top", type=int, default=20, help="number of categories to summarise (default: 20)")
+    add_parser = subparsers.add_parser(
+        "add",
+        help="record purchases without the interface, from the arguments or from category,cost[,time] lines on stdin",
+    )
+    add_parser.add_argument("category", nargs="?", help="category name, or the start of one")
+    add_parser.add_argument("cost", nargs="?")
+    add_parser.add_argument("--time", help="ISO 8601 time of the purchase (default: now)")
+    serve_parser = subparsers.add_parser("serve", help="serve the ledger as a JSON API over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve_parser.add_argument("--socket", help="listen on this Unix socket instead of a port")
+    return parser.parse_args(arguments)
+
+
+def run():
+    arguments = parse_arguments()
+    try:
+        datetime_tools.set_week_calendar(WeekCalendar(arguments.timezone, arguments.week_start))
+    except pytz.UnknownTimeZoneError:
+        sys.exit("Unknown timezone: " + arguments.timezone)
+    if arguments.command == "migrate":
+        run_migrate(arguments.direction)
+    elif arguments.command == "import":
+        run_import(get_storage(arguments.storage, arguments.partition_by), arguments)
+    elif arguments.command == "report":
+        run_report(get_storage(arguments.storage, arguments.partition_by), arguments)
+    elif arguments.command == "add":
+        run_add(get_storage(arguments.storage, arguments.partition_by), arguments)
+    elif arguments.command == "serve":
+        run_serve(get_storage(arguments.storage, arguments.partition_by), arguments)
+    else:
+        history_weeks = None if arguments.load_all else max(arguments.history_weeks, 1)
+        profile_output = arguments.profile_output if arguments.profile_interface else None
+        run_interface(get_storage(arguments.storage, arguments.partition_by), history_weeks, profile_output)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,55 @@
+import unittest
+from datetime import date
+from modules import datetime_tools
+from modules.WeekCalendar import WeekCalendar
+
+
+class WeekNavigationTest(unittest.TestCase):
+    """
+    Stepping week by week must land on the start of every week in turn,
+    including the weeks New Zealand's clocks change in
+    """
+    def setUp(self):
+        self.previous_calendar = datetime_tools.week_calendar
+        datetime_tools.set_week_calendar(WeekCalendar("Pacific/Auckland"))
+
+    def tearDown(self):
+        datetime_tools.set_week_calendar(self.previous_calendar)
+
+    def assert_steps(self, start_day, step, expected_days):
+        week_start = datetime_tools.week_calendar.get_start_of_date(start_day)
+        for expected_day in expected_days:
+            week_start = step(week_start)
+            self.assertEqual(week_start.date(), expected_day)
+            self.assertEqual(week_start.replace(tzinfo=None).time().hour, 0)
+            self.assertLess(week_start, datetime_tools.get_end_of_week(week_start))
+
+    def test_back_across_start_of_daylight_saving(self):
+        # clocks went forward on 27 September 2026
+        self.assert_steps(
+            date(2026, 10, 12),
+            datetime_tools.get_start_of_previous_week,
+            [date(2026, 10, 5), date(2026, 9, 28), date(2026, 9, 21), date(2026, 9, 14)],
+        )
+
+    def test_forward_across_end_of_daylight_saving(self):
+        # clocks went back on 5 April 2026
+        self.assert_steps(
+            date(2026, 3, 23),
+            datetime_tools.get_start_of_next_week,
+            [date(2026, 3, 30), date(2026, 4, 6), date(2026, 4, 13)],
+        )
+
+    def test_round_trip_over_a_year(self):
+        start = datetime_tools.week_calendar.get_start_of_date(date(2026, 1, 5))
+        week_start = start
+        for _ in range(52):
+            week_start = datetime_tools.get_start_of_next_week(week_start)
+        self.assertEqual(week_start.date(), date(2027, 1, 4))
+        for _ in range(52):
+            week_start = datetime_tools.get_start_of_previous_week(week_start)
+        self.assertEqual(week_start, start)
+
+
+if __name__ == "__main__":
+    unittest.main()